@@ -0,0 +1,210 @@
+"""
+Benchmarks of the hot paths of the bot, over a synthetic corpus of about 5570 municipalities (see synthetic.py). Runs
+fully offline: the articles are served by the local stand-in of local_site.py.
+
+From the repository root:
+    python benchmarks/run.py                  # compares against benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline  # records new baseline results
+
+The comparison fails (exit code 1) when a benchmark is slower than its baseline by more than the tolerance. The
+baseline only means something on the machine where it was recorded, so record a new one before comparing elsewhere.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPOSITORY_ROOT, 'src'))
+
+os.environ.setdefault('PYWIKIBOT_NO_USER_CONFIG', '2')  # there is no need of a user-config.py to run offline
+
+import action
+import dataset_store
+import indicators
+import municipality_registry
+import synthetic
+from general_utils import states
+from infobox import Infobox
+from local_site import LocalSite, LocalPage
+from reference_guard import REFERENCE_PATTERN, build_reference_index, extract_refname
+
+BASELINE_PATH = os.path.join(REPOSITORY_ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_TOLERANCE = 0.25  # fraction a benchmark may be slower than its baseline before it counts as a regression
+DEFAULT_REPEAT = 3
+
+
+class Corpus:
+    def __init__(self, directory: str, scale: float):
+        self.directory = directory
+        self.municipalities = synthetic.generate_municipalities(scale=scale)
+        synthetic.write_datafiles(directory, self.municipalities)
+        self.articles = synthetic.generate_articles(self.municipalities, states)
+
+        site = LocalSite(self.articles)
+        self.pages = [LocalPage(site, title) for title, text in self.articles.items() if 'Info/Município' in text]
+        for page in self.pages:
+            page.load()
+        self.infoboxes = [Infobox(page) for page in self.pages]
+        self.references = [match.group(0) for page in self.pages for match in REFERENCE_PATTERN.finditer(page.text)]
+
+
+def reset_loaded_data(remove_store: bool = False):
+    """Forgets everything loaded in memory, as a new execution would. Optionally removes the dataset store too."""
+    if dataset_store._connection is not None:
+        dataset_store._connection.close()
+        dataset_store._connection = None
+    dataset_store._loaded_datasets.clear()
+    municipality_registry._registry = None
+    indicators.compute_indicators.cache_clear()
+    if remove_store and os.path.exists(dataset_store.STORE_PATH):
+        os.remove(dataset_store.STORE_PATH)
+
+
+def make_all_cities_dicts():
+    for state in states:
+        action.make_cities_dict(state)
+
+
+def benchmark_make_cities_dict_cold():
+    reset_loaded_data(remove_store=True)
+    make_all_cities_dicts()
+
+
+def benchmark_make_cities_dict_warm():
+    reset_loaded_data()
+    make_all_cities_dicts()
+
+
+def benchmark_compute_indicators():
+    indicators.compute_indicators.cache_clear()
+    indicators.compute_indicators()
+
+
+def build_benchmarks(corpus: Corpus) -> dict:
+    """Returns a dict mapping benchmark names to (setup, function to be timed). The setup is not timed."""
+    def load_data():
+        reset_loaded_data()
+        make_all_cities_dicts()
+
+    return {
+        'make_cities_dict (cold store)': (None, benchmark_make_cities_dict_cold),
+        'make_cities_dict (warm store)': (None, benchmark_make_cities_dict_warm),
+        'compute_indicators': (load_data, benchmark_compute_indicators),
+        'Infobox parsing': (None, lambda: [Infobox(page) for page in corpus.pages]),
+        'generate_raw': (None, lambda: [infobox.generate_raw() for infobox in corpus.infoboxes]),
+        'render_article': (None, lambda: [infobox.render_article() for infobox in corpus.infoboxes]),
+        'extract_refname': (None, lambda: [extract_refname(reference) for reference in corpus.references]),
+        'build_reference_index': (None, lambda: [build_reference_index(page.text) for page in corpus.pages]),
+    }
+
+
+def run_benchmarks(corpus: Corpus, repeat: int, selected: str = None) -> dict:
+    results = {}
+    for name, (setup, function) in build_benchmarks(corpus).items():
+        if selected and not re.search(selected, name):
+            continue
+        if setup:
+            setup()
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start)
+        results[name] = {'best': round(min(durations), 4), 'median': round(statistics.median(durations), 4)}
+        print(f'{name:<32} best {results[name]["best"]:>9.4f}s   median {results[name]["median"]:>9.4f}s')
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns the names of the benchmarks whose best time regressed beyond the tolerance."""
+    regressions = []
+    print(f'\n{"benchmark":<32} {"baseline":>10} {"now":>10} {"change":>8}')
+    for name, numbers in results.items():
+        if name not in baseline['results']:
+            print(f'{name:<32} {"-":>10} {numbers["best"]:>9.4f}s {"new":>8}')
+            continue
+        before = baseline['results'][name]['best']
+        change = numbers['best'] / before - 1 if before else 0
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f'{name:<32} {before:>9.4f}s {numbers["best"]:>9.4f}s {change:>+7.0%}' + ('  REGRESSION' * regressed))
+    return regressions
+
+
+def describe_corpus(corpus: Corpus, scale: float) -> dict:
+    return {
+        'scale': scale,
+        'municipalities': len(corpus.municipalities),
+        'articles': len(corpus.pages),
+        'article_characters': sum(len(page.text) for page in corpus.pages),
+        'largest_article_characters': max(len(page.text) for page in corpus.pages),
+        'references': len(corpus.references)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the hot paths of the bot over a synthetic corpus.')
+    parser.add_argument('--save-baseline', action='store_true', help='record the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file to compare with or to write')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown before failing, as a fraction (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='runs of each benchmark; the best counts')
+    parser.add_argument('--scale', type=float, default=1.0, help='fraction of the real amount of municipalities')
+    parser.add_argument('--only', help='regular expression selecting the benchmarks to run')
+    parser.add_argument('--keep-corpus', action='store_true', help='do not delete the generated corpus directory')
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='atualizador-benchmark-')
+    working_directory = os.getcwd()
+    os.chdir(directory)  # the bot reads datafiles/ relative to the working directory
+    try:
+        start = time.perf_counter()
+        corpus = Corpus(directory, arguments.scale)
+        corpus_description = describe_corpus(corpus, arguments.scale)
+        print(f'Corpus generated in {time.perf_counter() - start:.1f}s at {directory}: {corpus_description}\n')
+        results = run_benchmarks(corpus, arguments.repeat, arguments.only)
+        reset_loaded_data()
+    finally:
+        os.chdir(working_directory)
+        if arguments.keep_corpus:
+            print(f'\nCorpus kept at {directory}')
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if arguments.save_baseline:
+        with open(arguments.baseline, 'w') as file:
+            json.dump({'machine': f'{platform.python_implementation()} {platform.python_version()}, '
+                                  f'{platform.machine()}, {os.cpu_count()} CPUs',
+                       'corpus': corpus_description, 'results': results}, file, indent=2, ensure_ascii=False)
+            file.write('\n')
+        print(f'\nBaseline written to {arguments.baseline}')
+        return
+
+    if not os.path.exists(arguments.baseline):
+        print(f'\nNo baseline at {arguments.baseline}. Record one with --save-baseline.')
+        return
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    if baseline['corpus']['scale'] != arguments.scale:
+        print(f'\nThe baseline was recorded with --scale {baseline["corpus"]["scale"]}, so it is not comparable.')
+        sys.exit(2)
+
+    regressions = compare_to_baseline(results, baseline, arguments.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} benchmark(s) slower than the baseline by more than {arguments.tolerance:.0%}: '
+              + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Generates a reproducible synthetic corpus shaped like the bot inputs: one article per municipality (about 5570, with
+the real amount of municipalities of each state) and IBGE/Atlas-shaped datafiles (pib.xls,
+pop_cidades_2022_previa.xls, gini-br.xls and the 27 info-*.csv files).
+
+Some articles are very large, have nested templates inside the infobox and reuse many named references, so the hot
+paths are measured on their worst cases too. Writing .xls files requires xlwt (a dev dependency).
+"""
+
+import csv
+import os
+import random
+import unicodedata
+import xlwt
+
+MUNICIPALITIES_PER_STATE = {
+    'AC': 22, 'AL': 102, 'AP': 16, 'AM': 62, 'BA': 417, 'CE': 184, 'DF': 1, 'ES': 78, 'GO': 246, 'MA': 217,
+    'MT': 141, 'MS': 79, 'MG': 853, 'PA': 144, 'PB': 223, 'PR': 399, 'PE': 185, 'PI': 224, 'RJ': 92, 'RN': 167,
+    'RS': 497, 'RO': 52, 'RR': 15, 'SC': 295, 'SP': 645, 'SE': 75, 'TO': 139
+}
+STATE_CODES = {
+    'RO': 11, 'AC': 12, 'AM': 13, 'RR': 14, 'PA': 15, 'AP': 16, 'TO': 17, 'MA': 21, 'PI': 22, 'CE': 23, 'RN': 24,
+    'PB': 25, 'PE': 26, 'AL': 27, 'SE': 28, 'BA': 29, 'MG': 31, 'ES': 32, 'RJ': 33, 'SP': 35, 'PR': 41, 'SC': 42,
+    'RS': 43, 'MS': 50, 'MT': 51, 'GO': 52, 'DF': 53
+}
+NAME_PARTS = ('São', 'Santa', 'Bom', 'Nova', 'Porto', 'Campo', 'Rio', 'Serra', 'Vila', 'Barra', 'Jardim', 'Alto')
+NAME_ENDINGS = ('Jesus', 'Esperança', 'Alegre', 'Grande', 'do Sul', 'Verde', 'Bonito', 'Formoso', 'da Conceição',
+                'dos Campos', 'Açu', 'Paraíso', 'Itaúna', 'Araçá', 'Belém', 'Jardim')
+LARGE_ARTICLE_RATIO = 0.01
+SHARED_NAME_RATIO = 0.05  # names repeated across states, whose articles are titled "City (State)"
+UNACCENTED_NAME_RATIO = 0.02  # names written without accents in the PIB and Gini tables
+
+
+def generate_municipalities(seed: int = 2022, scale: float = 1.0) -> list[tuple[str, str]]:
+    """Returns (state acronym, city name) pairs. Names are unique inside each state, and some repeat across states."""
+    randomizer = random.Random(seed)
+    municipalities = []
+    shared_names = [f'{part} {ending}' for part in NAME_PARTS[:4] for ending in NAME_ENDINGS[:4]]
+
+    for state, amount in MUNICIPALITIES_PER_STATE.items():
+        amount = max(1, round(amount * scale))
+        names = set()
+        while len(names) < amount:
+            if randomizer.random() < SHARED_NAME_RATIO:
+                names.add(randomizer.choice(shared_names))
+            else:
+                names.add(f'{randomizer.choice(NAME_PARTS)} {randomizer.choice(NAME_ENDINGS)} '
+                          f'{randomizer.randint(1, 99999)}')
+        municipalities += [(state, name) for name in sorted(names)]
+
+    return municipalities
+
+
+def write_datafiles(directory: str, municipalities: list[tuple[str, str]], seed: int = 2022):
+    randomizer = random.Random(seed)
+    datafiles = os.path.join(directory, 'datafiles')
+    os.makedirs(datafiles, exist_ok=True)
+    codes = generate_codes(municipalities)
+
+    for state in MUNICIPALITIES_PER_STATE:
+        with open(os.path.join(datafiles, f'info-{state.lower()}.csv'), 'w', newline='') as file:
+            writer = csv.writer(file, delimiter=';')
+            writer.writerows([['Municípios'], ['Fonte: IBGE'], ['Município', 'Código'] + 11 * ['']])
+            for city_state, city in municipalities:
+                if city_state != state:
+                    continue
+                hdi = '-' if randomizer.random() < 0.01 else f'0,{randomizer.randint(418, 862)}'
+                row = [city, codes[(state, city)]] + 11 * ['']
+                row[4] = f'{randomizer.uniform(3, 160000):.3f}'.replace('.', ',')
+                row[8] = hdi
+                row[12] = f'{randomizer.uniform(4000, 400000):.2f}'.replace('.', ',')
+                writer.writerow(row)
+            writer.writerows([13 * [''], ['Fontes: IBGE, Atlas Brasil']])
+
+    def name_in_national_table(state: str, city: str):
+        if randomizer.random() < UNACCENTED_NAME_RATIO:
+            city = unicodedata.normalize('NFKD', city).encode('ASCII', 'ignore').decode('ASCII')
+        return f'{city} ({state})'
+
+    igp_rows = [(name_in_national_table(state, city), round(randomizer.uniform(1e4, 7e8), 3))
+                for state, city in municipalities]
+    write_sheet(os.path.join(datafiles, 'pib.xls'), first_row=4, rows=igp_rows)
+
+    gini_rows = [(name_in_national_table(state, city), round(randomizer.uniform(0.28, 0.8), 4))
+                 for state, city in municipalities]
+    write_sheet(os.path.join(datafiles, 'gini-br.xls'), first_row=2, rows=gini_rows)
+
+    population_rows = []
+    for state, city in municipalities:
+        population = randomizer.randint(800, 12000000)
+        if randomizer.random() < 0.03:  # some populations come as text with footnote marks
+            population = f'{population:,}'.replace(',', '.') + '(1)'
+        code = codes[(state, city)]
+        population_rows.append((state, STATE_CODES[state], code[2:], city, population))
+    write_sheet(os.path.join(datafiles, 'pop_cidades_2022_previa.xls'), first_row=2, rows=population_rows)
+
+
+def generate_codes(municipalities: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+    """IBGE-like 7 digits codes: the code of the state followed by the position of the municipality in it."""
+    codes = {}
+    positions = {}
+    for state, city in municipalities:
+        positions[state] = positions.get(state, 0) + 1
+        codes[(state, city)] = f'{STATE_CODES[state]}{positions[state]:05d}'
+    return codes
+
+
+def write_sheet(path: str, first_row: int, rows: list[tuple]):
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet('Tabela')
+    sheet.write(0, 0, 'Tabela gerada para benchmarks')
+    for row_index, row in enumerate(rows, start=first_row):
+        for column_index, value in enumerate(row):
+            sheet.write(row_index, column_index, value)
+    # a blank row, then a footer, like the IBGE spreadsheets
+    sheet.write(first_row + len(rows) + 2, 0, 'Fonte: IBGE, Diretoria de Pesquisas')
+    workbook.save(path)
+
+
+def generate_articles(municipalities: list[tuple[str, str]], state_names: dict[str, str],
+                      seed: int = 2022) -> dict[str, str]:
+    """Returns a dict mapping titles to article sources. Cities whose name repeats across states get a
+    disambiguation page at the bare title."""
+    randomizer = random.Random(seed)
+    name_count = {}
+    for _, city in municipalities:
+        name_count[city] = name_count.get(city, 0) + 1
+
+    articles = {}
+    for state, city in municipalities:
+        state_name = state_names[state]
+        if name_count[city] > 1:
+            title = f'{city} ({state_name})'
+            articles[city] = '{{Desambiguação}}\n\'\'\'' + city + '\'\'\' pode referir-se a vários municípios.'
+        else:
+            title = city
+        large = randomizer.random() < LARGE_ARTICLE_RATIO
+        articles[title] = generate_article(randomizer, city, state_name, large)
+
+    return articles
+
+
+def generate_article(randomizer: random.Random, city: str, state_name: str, large: bool) -> str:
+    reference_count = randomizer.randint(100, 300) if large else randomizer.randint(3, 20)
+    section_count = randomizer.randint(40, 120) if large else randomizer.randint(2, 8)
+
+    infobox = '{{Info/Município do Brasil\n' \
+              f'| nome = {city}\n' \
+              f'| estado = {state_name}\n' \
+              f'| população = {randomizer.randint(800, 900000)}\n' \
+              '| população_ref = <ref name="pop_ibge">{{Citar web |url=https://ibge.gov.br/pop |titulo=Estimativa ' \
+              '|acessodata=1 de julho de 2021}}</ref>\n' \
+              '| data_pop = 2020\n' \
+              f'| área = {randomizer.uniform(3, 9000):.3f}\n' \
+              '| área_ref = <ref name="area">{{citar web|url=https://ibge.gov.br/area|titulo=Área}}</ref>\n' \
+              f'| idh = 0,{randomizer.randint(418, 862)} <!-- Atlas 2010 -->\n' \
+              '| idh_ref = <ref>{{citar web|url=https://atlasbrasil.org.br|titulo=Atlas}}</ref>\n' \
+              '| pib = {{fmtn|' + str(randomizer.randint(10000, 9000000)) + '|mil}}\n' \
+              '| prefeito = {{nowrap|Fulano de Tal}} ([[PSD]], {{dts|2021}})\n' \
+              '| apelido = {{lang|pt|Cidade Sorriso}}\n' \
+              '| site_prefeitura = [https://example.gov.br Prefeitura]\n' \
+              '}}\n'
+
+    text = f"'''{city}''' é um município brasileiro do estado de {state_name}.<ref name=\"pop_ibge\" />\n" + infobox
+    for section in range(section_count):
+        text += f'\n== Seção {section} ==\n'
+        for paragraph in range(randomizer.randint(1, 4)):
+            text += 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * randomizer.randint(3, 12)
+            if randomizer.random() < 0.3:
+                text += '{{Citação|texto={{lang|la|Lorem}} ipsum|autor=[[Fulano]]}} '
+            if randomizer.random() < 0.5:
+                text += '<ref name="area" /> '
+            text += '\n'
+
+    for reference in range(reference_count):
+        text += f'Fato {reference}.<ref name="r{reference}">{{{{Citar web |url=https://example.org/{reference} ' \
+                f'|titulo=Fonte {reference} |acessodata=1 de janeiro de 2020}}}}</ref> '
+        text += f'Outro fato.<ref name="r{randomizer.randint(0, reference)}" /> '
+
+    text += '\n\n== Referências ==\n{{Referências}}\n\n[[Categoria:Municípios de ' + state_name + ']]\n'
+    return text
@@ -0,0 +1,57 @@
+"""
+Data-only mode: computes the values and ranks of every city exactly as an execution would, and checks them, without
+loading pywikibot or touching Wikipedia. Run it with python src/main.py --data-only, from the repository root.
+"""
+
+from typing import Iterable
+from action import ALL_STATES, make_cities_dict
+from indicators import INDICATORS
+from municipality_registry import get_registry
+
+RANKED_VALUES = tuple(indicator.name for indicator in INDICATORS if indicator.ranking)
+
+
+def validate_city(data: dict) -> list[str]:
+    """Returns the problems found in the data of a city, as made by make_cities_dict."""
+    problems = []
+    if not data.get('population'):
+        problems.append('no population')
+    if not data.get('area') or data['area'] <= 0:
+        problems.append(f'invalid area: {data.get("area")}')
+    if data.get('hdi') is not None and not 0 < data['hdi'] <= 1:
+        problems.append(f'HDI out of range: {data["hdi"]}')
+    if data.get('gini') is not None and not 0 < data['gini'] < 1:
+        problems.append(f'Gini index out of range: {data["gini"]}')
+    if data.get('igp_per_capita') is None or data['igp_per_capita'] <= 0:
+        problems.append(f'invalid IGP per capita: {data.get("igp_per_capita")}')
+
+    for value in RANKED_VALUES:
+        rank_br = data.get(f'{value}_rank_br')
+        rank_state = data.get(f'{value}_rank_state')
+        if data.get(value) is None:
+            continue
+        if not (rank_br and rank_state):
+            problems.append(f'{value} without rank')
+        elif rank_state > rank_br:
+            problems.append(f'{value} rank in the state ({rank_state}) after the national rank ({rank_br})')
+
+    return problems
+
+
+def check_data(target_states: Iterable[str] = ALL_STATES) -> int:
+    """Prints the problems of every city of the states and returns how many there are, counting the rows of the tables
+    that match no municipality."""
+    target_states = tuple(target_states)
+    city_count = 0
+    problem_count = 0
+    for state in target_states:
+        for city, data in make_cities_dict(state).items():
+            city_count += 1
+            for problem in validate_city(data):
+                print(f'{city} ({state}): {problem}')
+                problem_count += 1
+
+    unmatched_count = len(get_registry().unmatched)
+    print(f'{city_count} cities of {len(target_states)} states checked: {problem_count} problems, '
+          f'{unmatched_count} unmatched rows.')
+    return problem_count + unmatched_count
@@ -0,0 +1,221 @@
+"""
+Lazy readers for the tables published by IBGE and Atlas Brasil. A table is described by a TableSchema (where the data
+starts, which columns hold each field and how to parse them, and which column marks the end of the table), so a new
+yearly release only needs a new schema, not a new parsing function.
+
+Rows are read one at a time and only the columns named by the schema are kept. .csv and .ods files are streamed,
+.xls files are read sheet by sheet and .xlsx files are read with openpyxl in read-only mode (it must be installed to
+read them).
+"""
+
+import csv
+import os
+import re
+import xlrd
+import zipfile
+from typing import Any, Callable, Iterator, NamedTuple, Optional, Union
+from xml.etree import ElementTree
+
+
+class Column(NamedTuple):
+    # position in the row, counting from 0, or a tuple of positions, whose cells are parsed together, or the name of a
+    # group of TableSchema.path_pattern
+    index: Union[int, tuple[int, ...], str]
+    parse: Callable[[Any], Any] = str
+
+
+class TableSchema(NamedTuple):
+    first_row: int  # rows before the data (titles, headers), counting from 0
+    columns: dict[str, Column]
+    end_column: str = 'city'  # the table ends at the first row where this field is blank
+    sheet: int = 0
+    delimiter: str = ';'  # only for .csv files
+    path_pattern: Optional[str] = None  # regular expression whose named groups are fields taken from the file name
+
+
+def decimal_comma(value) -> Optional[float]:
+    """Numbers written as 1.234,5. A dash means the number is not available."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = value.strip()
+    if value in ('', '-'):
+        return None
+    return float(value.replace('.', '').replace(',', '.'))
+
+
+def integer(value) -> int:
+    """Integers, also when written as text with separators or footnote marks, such as 12.345(1)."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(re.sub('[^0-9]', '', re.sub(r'\(.*?\)', '', value)))
+
+
+def scaled(factor: float) -> Callable[[Any], float]:
+    """Numbers published in another unit, such as thousands of reais."""
+    return lambda value: float(value) * factor
+
+
+def ibge_code(value) -> Optional[str]:
+    """The 7 digits IBGE code of a municipality, or None if the cell is blank."""
+    digits = code_digits(value)
+    return digits.zfill(7) if digits else None
+
+
+def ibge_code_from_parts(values: tuple) -> Optional[str]:
+    """The 7 digits IBGE code of a municipality published in two cells, the code of the state and the code of the
+    municipality in the state, or None if any of them is blank."""
+    state_digits, municipality_digits = code_digits(values[0]), code_digits(values[1])
+    if not (state_digits and municipality_digits):
+        return None
+    return state_digits.zfill(2) + municipality_digits.zfill(5)
+
+
+def code_digits(value) -> str:
+    if isinstance(value, float):
+        value = int(value)  # numeric cells of spreadsheets are read as floats
+    return re.sub('[^0-9]', '', str(value if value is not None else ''))
+
+
+def state_from_name_with_state(value: str) -> str:
+    """Takes a name formatted as "City (UF)"."""
+    return value.strip()[-3:-1]
+
+
+def city_from_name_with_state(value: str) -> str:
+    """Takes a name formatted as "City (UF)"."""
+    return value.strip()[:-5]
+
+
+def read_table(path: str, schema: TableSchema, fields: tuple[str, ...]) -> Iterator[tuple]:
+    """Yields a tuple with the fields of each row of the table, in the given order."""
+    path_values = {}
+    if schema.path_pattern:
+        path_values = re.search(schema.path_pattern, os.path.basename(path)).groupdict()
+
+    indexes = []
+    for column in schema.columns.values():
+        if isinstance(column.index, int):
+            indexes.append(column.index)
+        elif isinstance(column.index, tuple):
+            indexes += column.index
+    width = max(indexes) + 1
+    end_column = schema.columns[schema.end_column]
+
+    for cells in read_cells(path, schema, width):
+        if is_blank(cells[end_column.index]):
+            break
+        row = []
+        for field in fields:
+            column = schema.columns[field]
+            if isinstance(column.index, str):
+                value = path_values[column.index]
+            elif isinstance(column.index, tuple):
+                value = tuple(cells[index] for index in column.index)
+            else:
+                value = cells[column.index]
+            row.append(column.parse(value))
+        yield tuple(row)
+
+
+def is_blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def read_cells(path: str, schema: TableSchema, width: int) -> Iterator[list]:
+    """Yields the first width cells of each data row, padded with None."""
+    extension = os.path.splitext(path)[1].lower()
+    readers = {'.csv': read_csv_cells, '.xls': read_xls_cells, '.xlsx': read_xlsx_cells, '.ods': read_ods_cells}
+    if extension not in readers:
+        raise ValueError(f'Unsupported table format: {path}')
+
+    for cells in readers[extension](path, schema, width):
+        cells = list(cells[:width])
+        yield cells + [None] * (width - len(cells))
+
+
+def read_csv_cells(path: str, schema: TableSchema, width: int):
+    with open(path, newline='') as file:
+        reader = csv.reader(file, delimiter=schema.delimiter)
+        for row_index, row in enumerate(reader):
+            if row_index >= schema.first_row:
+                yield row
+
+
+def read_xls_cells(path: str, schema: TableSchema, width: int):
+    workbook = xlrd.open_workbook(path, on_demand=True)  # only the sheet of the table is loaded
+    try:
+        sheet = workbook.sheet_by_index(schema.sheet)
+        for row_index in range(schema.first_row, sheet.nrows):
+            yield sheet.row_values(row_index, end_colx=min(width, sheet.row_len(row_index)))
+    finally:
+        workbook.release_resources()
+
+
+def read_xlsx_cells(path: str, schema: TableSchema, width: int):
+    import openpyxl  # only needed for .xlsx releases
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[schema.sheet]
+        yield from sheet.iter_rows(min_row=schema.first_row + 1, max_col=width, values_only=True)
+    finally:
+        workbook.close()
+
+
+ODS_TABLE = '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}'
+ODS_OFFICE = '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}'
+ODS_TEXT = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+
+def read_ods_cells(path: str, schema: TableSchema, width: int):
+    """Streams the rows of the sheet from the content.xml of the OpenDocument file, never holding the whole
+    document in memory."""
+    with zipfile.ZipFile(path) as archive, archive.open('content.xml') as content:
+        sheet_index = -1
+        row_index = 0
+        for event, element in ElementTree.iterparse(content, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == ODS_TABLE + 'table':
+                    sheet_index += 1
+                    row_index = 0
+                continue
+
+            if element.tag == ODS_TABLE + 'table' and sheet_index == schema.sheet:
+                return
+            if element.tag != ODS_TABLE + 'table-row':
+                continue
+
+            if sheet_index == schema.sheet:
+                repeat = int(element.get(ODS_TABLE + 'number-rows-repeated', '1'))
+                cells = ods_row_cells(element, width)
+                if is_blank_row(cells):  # trailing blank rows may be repeated a million times
+                    repeat = min(repeat, 1 + max(0, schema.first_row - row_index))
+                for _ in range(repeat):
+                    if row_index >= schema.first_row:
+                        yield cells
+                    row_index += 1
+            element.clear()
+
+
+def ods_row_cells(row, width: int) -> list:
+    cells = []
+    for cell in row:
+        if cell.tag not in (ODS_TABLE + 'table-cell', ODS_TABLE + 'covered-table-cell'):
+            continue
+        value_type = cell.get(ODS_OFFICE + 'value-type')
+        if value_type in ('float', 'percentage', 'currency'):
+            value = float(cell.get(ODS_OFFICE + 'value'))
+        elif value_type is None:
+            value = None
+        else:
+            value = '\n'.join(''.join(paragraph.itertext()) for paragraph in cell.iter(ODS_TEXT + 'p'))
+        repeat = int(cell.get(ODS_TABLE + 'number-columns-repeated', '1'))
+        cells += [value] * min(repeat, width - len(cells))
+        if len(cells) >= width:
+            break
+    return cells
+
+
+def is_blank_row(cells: list) -> bool:
+    return all(is_blank(value) for value in cells)
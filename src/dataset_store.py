@@ -0,0 +1,169 @@
+"""
+Compact local store for the national datasets (IBGE spreadsheets and Atlas Brasil CSVs).
+
+Parsing the source spreadsheets is by far the slowest part of loading the data, and they only change once a year.
+So every source file is ingested once into a SQLite file, keyed by municipality, and a manifest keeps the SHA-256
+of each ingested file. A dataset is only re-ingested when the content of one of its source files changes.
+The changed files are parsed in a process pool, one task per file, since parsing is CPU-bound.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+from dataset_readers import Column, TableSchema, city_from_name_with_state, decimal_comma, ibge_code, \
+    ibge_code_from_parts, integer, read_table, scaled, state_from_name_with_state
+from general_utils import states
+
+STORE_PATH = 'datafiles/datasets.sqlite3'
+STORE_VERSION = 3
+
+
+# dataset name -> (value columns, schema of the source files, source files). A new release of a table only needs a new
+# schema. If the schema of an already ingested file changes, bump STORE_VERSION so the file is ingested again.
+DATASETS = {
+    'municipality_info': (('code', 'area', 'hdi', 'igp_per_capita'),
+                          TableSchema(first_row=3, path_pattern=r'info-(?P<state>\w{2})\.csv$', columns={
+                              'state': Column('state', str.upper),
+                              'city': Column(0),
+                              'code': Column(1, ibge_code),
+                              'area': Column(4, decimal_comma),
+                              'hdi': Column(8, decimal_comma),  # some cities don't have HDI calculated
+                              'igp_per_capita': Column(12, decimal_comma)
+                          }),
+                          tuple(f'datafiles/info-{state.lower()}.csv' for state in states)),
+    'igp': (('igp',),
+            TableSchema(first_row=4, columns={
+                'state': Column(0, state_from_name_with_state),
+                'city': Column(0, city_from_name_with_state),
+                'igp': Column(1, scaled(1000))  # published in thousands of reais
+            }),
+            ('datafiles/pib.xls',)),
+    'population': (('code', 'population'),
+                   TableSchema(first_row=2, end_column='state', columns={
+                       'state': Column(0),
+                       'city': Column(3),
+                       'code': Column((1, 2), ibge_code_from_parts),
+                       'population': Column(4, integer)
+                   }),
+                   ('datafiles/pop_cidades_2022_previa.xls',)),
+    'gini': (('gini',),
+             TableSchema(first_row=2, columns={
+                 'state': Column(0, state_from_name_with_state),
+                 'city': Column(0, city_from_name_with_state),
+                 'gini': Column(1, float)
+             }),
+             ('datafiles/gini-br.xls',)),
+}
+
+_connection = None
+_lock = threading.Lock()  # the data may be loaded from the fetch stage of the edit pipeline
+_loaded_datasets = {}  # dataset name -> (all rows, rows grouped by state), so each one is read once per execution
+
+
+def read_dataset(dataset: str, state: str = None) -> list[tuple]:
+    """Returns the rows (state, city, *values) of the dataset in the order they appear in the source files,
+    optionally filtered by state acronym. The dataset is re-ingested first if any of its source files changed."""
+    load_datasets(dataset)
+    rows, rows_by_state = _loaded_datasets[dataset]
+    if state:
+        return rows_by_state.get(state.upper(), [])
+    return rows
+
+
+def load_datasets(*datasets: str):
+    """Loads the datasets in memory, if not loaded yet. Loading several at once lets their changed source files be
+    parsed in parallel."""
+    with _lock:
+        pending = [dataset for dataset in datasets if dataset not in _loaded_datasets]
+        if not pending:
+            return
+
+        connection = get_store()
+        ensure_fresh(connection, pending)
+        for dataset in pending:
+            columns = ', '.join(('state', 'city') + DATASETS[dataset][0])
+            rows = connection.execute(f'SELECT {columns} FROM {dataset} ORDER BY rowid').fetchall()
+            rows_by_state = {}
+            for row in rows:
+                rows_by_state.setdefault(row[0], []).append(row)
+            _loaded_datasets[dataset] = (rows, rows_by_state)
+
+
+def get_store() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(STORE_PATH, check_same_thread=False)
+        create_schema(_connection)
+    return _connection
+
+
+def create_schema(connection: sqlite3.Connection):
+    if connection.execute('PRAGMA user_version').fetchone()[0] != STORE_VERSION:
+        # layout changed since the store was written, so everything must be ingested again
+        for dataset in list(DATASETS) + ['manifest']:
+            connection.execute(f'DROP TABLE IF EXISTS {dataset}')
+        connection.execute(f'PRAGMA user_version = {STORE_VERSION}')
+
+    connection.execute('CREATE TABLE IF NOT EXISTS manifest (source TEXT PRIMARY KEY, sha256 TEXT NOT NULL)')
+    for dataset, (value_columns, _, _) in DATASETS.items():
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {dataset} (source TEXT NOT NULL, state TEXT NOT NULL, '
+                           f'city TEXT NOT NULL, {", ".join(value_columns)})')
+    connection.commit()
+
+
+def ensure_fresh(connection: sqlite3.Connection, datasets: list[str]):
+    """Re-ingests every source file of the datasets whose content hash differs from the one in the manifest, and drops
+    the rows of the files no longer listed as sources, such as the release replaced by a renamed one."""
+    stale = []
+    for dataset in datasets:
+        remove_unlisted_sources(connection, dataset)
+        for source in DATASETS[dataset][2]:
+            digest = file_digest(source)
+            stored = connection.execute('SELECT sha256 FROM manifest WHERE source = ?', (source,)).fetchone()
+            if not stored or stored[0] != digest:
+                stale.append((dataset, source, digest))
+
+    if len(stale) < 2:
+        parsed = (parse_source(dataset, source) for dataset, source, _ in stale)
+        store_sources(connection, stale, parsed)
+        return
+
+    # the schemas hold lambdas, so the tasks only carry names and each worker looks the schema up in its own DATASETS
+    with ProcessPoolExecutor(max_workers=min(len(stale), os.cpu_count() or 1)) as pool:
+        parsed = pool.map(parse_source, *zip(*((dataset, source) for dataset, source, _ in stale)))
+        store_sources(connection, stale, parsed)
+
+
+def remove_unlisted_sources(connection: sqlite3.Connection, dataset: str):
+    sources = DATASETS[dataset][2]
+    placeholders = ', '.join('?' * len(sources))
+    with connection:
+        removed = connection.execute(f'SELECT DISTINCT source FROM {dataset} WHERE source NOT IN ({placeholders})',
+                                     sources).fetchall()
+        connection.execute(f'DELETE FROM {dataset} WHERE source NOT IN ({placeholders})', sources)
+        connection.executemany('DELETE FROM manifest WHERE source = ?', removed)
+
+
+def parse_source(dataset: str, source: str) -> list[tuple]:
+    """Reads the rows (state, city, *values) of one source file of the dataset. Runs in a worker process."""
+    value_columns, schema, _ = DATASETS[dataset]
+    return list(read_table(source, schema, ('state', 'city') + value_columns))
+
+
+def store_sources(connection: sqlite3.Connection, stale: list[tuple], parsed: Iterable[list[tuple]]):
+    """Writes the parsed rows of each stale (dataset, source, digest) as soon as they arrive, in source order."""
+    for (dataset, source, digest), rows in zip(stale, parsed):
+        placeholders = ', '.join('?' * (3 + len(DATASETS[dataset][0])))
+        with connection:  # one transaction per source file, so a crash never leaves it half ingested
+            connection.execute(f'DELETE FROM {dataset} WHERE source = ?', (source,))
+            connection.executemany(f'INSERT INTO {dataset} VALUES ({placeholders})',
+                                   ((source,) + row for row in rows))
+            connection.execute('INSERT OR REPLACE INTO manifest VALUES (?, ?)', (source, digest))
+
+
+def file_digest(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
@@ -0,0 +1,47 @@
+"""
+Offline dry run: instead of saving, every edit writes the old source, the new source and a unified diff of the
+article to an output directory, without asking anything to the operator. An index file lists every edit.
+
+Enable it with DRY_RUN=1 in the .env file. The output directory is set by DRY_RUN_OUTPUT_DIR.
+"""
+
+import difflib
+import os
+import threading
+
+INDEX_FILE_NAME = 'index.tsv'
+OUTPUT_EXTENSIONS = ('.old.wiki', '.new.wiki', '.diff')
+
+
+class DryRunOutput:
+    def __init__(self, output_dir: str, resume: bool = False):
+        """A resumed dry run keeps the output of the interrupted one."""
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(output_dir, INDEX_FILE_NAME)
+        os.makedirs(output_dir, exist_ok=True)
+        if resume and os.path.exists(self.index_path):
+            return
+
+        # leftovers of a previous dry run would be mistaken by files of this one
+        for file_name in os.listdir(output_dir):
+            if file_name.endswith(OUTPUT_EXTENSIONS):
+                os.remove(os.path.join(output_dir, file_name))
+
+        with open(self.index_path, 'w') as index:
+            index.write('id\tstatus\ttitle\turl\tdiff\n')
+
+    def write_edit(self, edit_id: int, title: str, url: str, old_source: str, new_source: str):
+        base_name = str(edit_id).zfill(5)
+        diff = difflib.unified_diff(old_source.splitlines(keepends=True), new_source.splitlines(keepends=True),
+                                    fromfile=f'{title} (atual)', tofile=f'{title} (novo)')
+
+        for extension, content in (('.old.wiki', old_source), ('.new.wiki', new_source), ('.diff', ''.join(diff))):
+            with open(os.path.join(self.output_dir, base_name + extension), 'w') as file:
+                file.write(content)
+
+        self.add_to_index(edit_id, 'written', title, url, base_name + '.diff')
+
+    def add_to_index(self, edit_id: int, status: str, title: str, url: str, diff_file_name: str = ''):
+        with self.lock, open(self.index_path, 'a') as index:
+            index.write(f'{edit_id}\t{status}\t{title}\t{url}\t{diff_file_name}\n')
@@ -1,95 +1,363 @@
-import pyperclip
+import json
 import os
-from page_utils import find_city_article, produce_new_raw
+import time
+from contextlib import contextmanager
+from itertools import groupby
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+from page_utils import find_city_article, get_site, new_page
 from general_utils import get_state_name_by_acronym
+from dry_run import DryRunOutput
+from fingerprints import PUBLISHED_VALUES_PATH, PublishedValues, city_fingerprint
 from history import new_history_entry
 from infobox import Infobox
-from pywikibot import Page
+from journal import FINISHED_STATUSES, Journal, JOURNAL_PATH
+from local_site import is_local_site_enabled, local_output_path
+from performance import build_performance_report, format_performance_report
 
-debugging = int(os.getenv('DEBUG_MODE'))
+if TYPE_CHECKING:
+    from pywikibot import Page
+    from job import Job
+    from pipeline import RetryQueue
+    from throttle import AdaptiveThrottle
+
+MAX_SAVE_RETRIES = 3  # after the wiki pushed back, see throttle.py
+
+
+def is_debugging():
+    return bool(int(os.getenv('DEBUG_MODE') or 0))
+
+
+def is_dry_running():
+    return bool(int(os.getenv('DRY_RUN') or 0))
+
+
+def dry_run_output_dir():
+    return os.getenv('DRY_RUN_OUTPUT_DIR', 'dry-run')
+
+
+def saves_to_wiki():
+    """Whether the edits are actually saved, as opposed to debug mode and dry runs."""
+    return not (is_debugging() or is_dry_running())
+
+
+class EditResult:
+    """Outcome of an edit, which is all that is kept of it once the edit is over. Has the timings, success and retries
+    attributes that performance.py takes."""
+    __slots__ = ('id', 'title', 'status', 'revision_id', 'timings', 'duration', 'retries')
+
+    def __init__(self, edit_id: int, title: str, status: str, revision_id: Optional[int], timings: dict,
+                 duration: float, retries: int):
+        self.id = edit_id
+        self.title = title
+        self.status = status
+        self.revision_id = revision_id
+        self.timings = timings
+        self.duration = duration
+        self.retries = retries
+
+    @property
+    def success(self):
+        return self.status == 'done'
+
+    @property
+    def skipped(self):
+        return self.status == 'skipped'
 
 
 class Edit:
-    def __init__(self, article: Page, edit_id: int, city_name: str, state_acronym: str, summary: str):
+    def __init__(self, article: 'Page', edit_id: int, city_name: str, state_name: str, summary: str,
+                 dry_run_output: DryRunOutput = None, journal: Journal = None,
+                 published_values: PublishedValues = None, fingerprint: tuple[str, str] = None,
+                 on_outcome: Callable[[EditResult], None] = None):
+        """The fingerprint, as (IBGE code, fingerprint), is recorded in the published values once the edit is
+        finished. Once the outcome is known, on_outcome receives its result and the article is released, so an
+        execution never holds more articles than the ones still in the pipeline."""
         self.success = None
+        self.skipped = False
         self.id = edit_id
         self.article = article
-        self.edit_title = f'[{edit_id}] {city_name} - {state_acronym} ({article.full_url()})'
+        self.city_name = city_name
+        self.state_name = state_name
+        self.edit_title = f'[{edit_id}] {city_name} - {state_name} ({article.full_url()})'
         self.summary = summary
+        self.dry_run_output = dry_run_output
+        self.journal = journal
+        self.published_values = published_values
+        self.fingerprint = fingerprint
+        self.old_source = None
+        self.started_at = time.monotonic()
+        self.duration = None  # seconds from creation to outcome
+        self.timings = {}  # stage -> seconds spent in it, see performance.py
+        self.retries = 0
+        self.operations = None  # edit operations recorded by the infobox, replayed if the save must be redone
+        self.reapplications = 0
+        self.on_outcome = on_outcome
+
+    @contextmanager
+    def measure(self, stage: str):
+        """Adds the time spent inside the block to the timing of the stage."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + time.perf_counter() - started_at
 
     def get_infobox(self):
-        return Infobox(self.article)
+        with self.measure('parse'):
+            return Infobox(self.article)
 
     def commit(self, new_infobox: Infobox):
-        new_source = produce_new_raw(self.article.text, new_infobox.generate_raw())
-        self.article.text = new_source
+        self.prepare(new_infobox)
+        if self.skipped:
+            self.report_skip()
+        else:
+            self.save()
+
+    def prepare(self, new_infobox: Infobox):
+        """Writes the new infobox into the article source, without saving it. If no field actually changed, or the
+        new source is identical to the current one, the edit is marked as skipped and the article is left alone."""
+        with self.measure('render'):
+            self.operations = new_infobox.operations
+            self.old_source = self.article.text
+            if not new_infobox.changed_fields():
+                self.skipped = True
+                return
+
+            new_source = new_infobox.render_article()
+            if new_source == self.old_source:
+                self.skipped = True
+                return
+            self.article.text = new_source
+
+    def save(self, throttle: 'AdaptiveThrottle' = None, retry_queue: 'RetryQueue' = None):
+        """Saves the article, paced by the throttle if given. Saves that fail because the wiki pushed back are retried
+        after the throttle backed off. Saves that still fail, or hit an edit conflict, are handed to the retry queue
+        instead of reported as failures, if it accepts them."""
         try:
-            if debugging:
-                pyperclip.copy(new_source)
-                print(f'New source for {self.article.title()} ({self.article.full_url()}) was copied to clipboard.')
-                input('Press any key to continue.\n')
+            if self.dry_run_output:
+                self.dry_run_output.write_edit(self.id, self.article.title(), self.article.full_url(),
+                                               self.old_source, self.article.text)
+            elif is_debugging():
+                if not self.copy_to_clipboard():
+                    return
             else:
-                self.article.save(summary=self.summary)
-        except pyperclip.PyperclipException:
-            print('Error while trying to copy raw to clipboard. Please, make sure you have xclip installed in your')
-            print('system (in case of Linux): sudo apt install xclip')
-            return
+                self.save_to_wiki(throttle)
         except KeyboardInterrupt:
             quit()
-        except:
+        except Exception as error:
+            if retry_queue and retry_queue.offer(self, error):
+                print('Queued for a new attempt:', self.edit_title, f'({type(error).__name__})')
+                return
             self.report_failure()
             return
 
         print('Success at', self.edit_title)
         self.success = True
+        self._record_outcome('done', self.article.latest_revision_id if saves_to_wiki() else None)
+
+    def save_to_wiki(self, throttle: 'AdaptiveThrottle' = None):
+        while True:
+            if throttle:
+                with self.measure('throttle'):
+                    throttle.wait()
+            started_at = time.perf_counter()
+            try:
+                with self.measure('save'):
+                    self.article.save(summary=self.summary)
+            except Exception as error:
+                if throttle and throttle.record(time.perf_counter() - started_at, error) \
+                        and self.retries < MAX_SAVE_RETRIES:
+                    self.retries += 1
+                    continue
+                raise
+            if throttle:
+                throttle.record(time.perf_counter() - started_at)
+            return
+
+    def reapply(self):
+        """Loads the current revision of the article and repeats the recorded operations on its infobox, for a new
+        attempt after the article changed under the edit."""
+        self.reapplications += 1
+        self.retries += 1
+        self.article = new_page(self.article.site, self.article.title())
+        infobox = self.get_infobox()  # loads and parses the current revision
+        with self.measure('transform'):
+            infobox.replay(self.operations)
+        self.skipped = False
+        self.prepare(infobox)
+
+    def copy_to_clipboard(self):
+        import pyperclip  # only needed in debug mode
+
+        try:
+            pyperclip.copy(self.article.text)
+        except pyperclip.PyperclipException:
+            print('Error while trying to copy raw to clipboard. Please, make sure you have xclip installed in your')
+            print('system (in case of Linux): sudo apt install xclip')
+            return False
+        print(f'New source for {self.article.title()} ({self.article.full_url()}) was copied to clipboard.')
+        input('Press any key to continue.\n')
+        return True
+
+    def report_skip(self):
+        print('Skipped, up to date:', self.edit_title)
+        if self.dry_run_output:
+            self.dry_run_output.add_to_index(self.id, 'skipped', self.article.title(), self.article.full_url())
+        self._record_outcome('skipped')
 
     def report_failure(self):
         print('Failure at', self.edit_title)
         self.success = False
+        if self.dry_run_output:
+            self.dry_run_output.add_to_index(self.id, 'failed', self.article.title(), self.article.full_url())
+        self._record_outcome('failed')
+
+    def _record_outcome(self, status: str, revision_id: int = None):
+        self.duration = time.monotonic() - self.started_at
+        title = self.article.title()
+        if self.journal:
+            timings = {stage: round(duration, 4) for stage, duration in self.timings.items()}
+            timings['total'] = round(self.duration, 3)
+            self.journal.record(self.id, self.city_name, self.state_name, title, status, revision_id, timings)
+        if self.published_values and self.fingerprint and status in FINISHED_STATUSES:
+            self.published_values.record(*self.fingerprint)
+        if self.on_outcome:
+            self.on_outcome(EditResult(self.id, title, status, revision_id, self.timings, self.duration, self.retries))
+
+        # the sources of a large article take hundreds of kilobytes, and nothing needs them anymore
+        self.article = None
+        self.old_source = None
+        self.operations = None
 
 
 class SerialEdits:
-    def __init__(self):
+    def __init__(self, job: 'Job', resume: bool = False):
+        """The operator and the summaries come from the job (see job.py). When resuming, the cities already finished
+        according to the journal of the previous execution are skipped."""
+        self.operator = job.operator
+        self.reference_summary = job.reference_summary
         self.current_id = 1
-        self.edits = []
+        self.created_count = 0
+        self.results = []  # EditResult of every edit whose outcome is known, see Edit
+        self.dry_run_output = None
+        self.journal = None
+        self.published_values = None
+        self.pending_fingerprints = {}  # (city, state) -> (IBGE code, fingerprint), see outdated_cities
+        self.throttle = None  # paces the saves, set by the pipeline that runs the edits
+        self.started_at = time.monotonic()
 
-        if debugging:
+        if is_dry_running():
+            self.dry_run_output = DryRunOutput(dry_run_output_dir(), resume)
+            # dry runs keep their own journal, so they never mark cities as done for actual executions
+            self.journal = Journal(os.path.join(dry_run_output_dir(), JOURNAL_PATH), resume)
+            self.current_id = self.journal.last_edit_id + 1  # a resumed execution keeps numbering its edits
+            self.published_values = PublishedValues(read_only=True)
             self.public_summary = 'Teste de edição do Atualizador-cidades-bot'
             return
 
-        while True:
-            operator = input('Please, identify yourself as a operator. ')
-            reference_summary = input('Provide a brief summary for internal reference. ')
-            public_summary = input('Write the edit summary (it will appear at each article history). ')
-
-            print('You are', operator)
-            print('Description of this execution:', reference_summary)
-            print('Each edit will be recorded with the message:', public_summary)
-            print('Do you confirm this information and do you want to proceed with the execution?')
-            answer = input('[y] to confirm, any other input to repeat the questions. ')
-            if answer.lower() == 'y':
-                break
-
-        self.operator = operator
-        self.reference_summary = reference_summary
-        self.public_summary = public_summary.strip()
-
-    def new_edit(self, city_name: str, state: str):
+        if is_debugging():
+            self.published_values = PublishedValues(read_only=True)
+            self.public_summary = 'Teste de edição do Atualizador-cidades-bot'
+            return
+
+        if is_local_site_enabled():
+            # executions against the local stand-in are measured, but never recorded in the history
+            self.journal = Journal(local_output_path(JOURNAL_PATH), resume)
+            self.current_id = self.journal.last_edit_id + 1
+            self.published_values = PublishedValues(local_output_path(PUBLISHED_VALUES_PATH))
+            self.public_summary = 'Teste de edição do Atualizador-cidades-bot'
+            return
+
+        self.journal = Journal(JOURNAL_PATH, resume)
+        self.current_id = self.journal.last_edit_id + 1  # a resumed execution keeps numbering its edits
+        self.published_values = PublishedValues()
+        self.public_summary = job.summary
+
+    def new_edit(self, city_name: str, state: str, article: 'Page' = None):
+        """Creates the edit for the city. Pass the article if it was already loaded (see prefetch_city_articles),
+        otherwise it will be searched for."""
         state_name = get_state_name_by_acronym(state) if len(state) == 2 else state
-        page = find_city_article(city_name, state_name)
-        new_edit = Edit(page, self.current_id, city_name, state_name, self.public_summary)
-        self.edits.append(new_edit)
+        started_at = time.perf_counter()
+        page = article or find_city_article(city_name, state_name)
+        lookup_time = time.perf_counter() - started_at
+        new_edit = Edit(page, self.current_id, city_name, state_name, self.public_summary, self.dry_run_output,
+                        self.journal, self.published_values, self.pending_fingerprints.pop((city_name, state), None),
+                        on_outcome=self.results.append)
+        if not article:
+            new_edit.timings['lookup'] = lookup_time
+        self.created_count += 1
         self.current_id += 1
         return new_edit
 
+    def is_finished(self, city_name: str, state: str):
+        """Whether the city was already finished by the execution being resumed."""
+        state_name = get_state_name_by_acronym(state) if len(state) == 2 else state
+        return bool(self.journal) and self.journal.is_finished(city_name, state_name)
+
+    def outdated_cities(self, jobs: Iterable[tuple[str, str, dict]], context: Iterable = ()):
+        """Yields the (city, state, city data) jobs whose values differ from the ones last published. The fingerprints
+        are computed for all the cities of a state at once, and recorded when their edits are finished. Cities without
+        an IBGE code are always edited."""
+        context = tuple(context)
+        for _, state_jobs in groupby(jobs, key=lambda job: job[1]):
+            state_jobs = list(state_jobs)
+            fingerprints = {data['code']: city_fingerprint(data, context)
+                            for _, _, data in state_jobs if data.get('code')}
+            outdated_codes = self.published_values.outdated(fingerprints)
+            up_to_date_count = len(fingerprints) - len(outdated_codes)
+            if up_to_date_count:
+                print(f'{up_to_date_count} of {len(state_jobs)} cities of {state_jobs[0][1]} skipped, their values '
+                      'were already published')
+            for city, state, data in state_jobs:
+                code = data.get('code')
+                if code and code not in outdated_codes:
+                    continue
+                if code:
+                    self.pending_fingerprints[(city, state)] = (code, fingerprints[code])
+                yield city, state, data
+
     def finish(self):
-        if debugging:
-            return
+        if self.journal:
+            self.journal.close()
+        if self.published_values:
+            self.published_values.close()
+
+        performance_report = build_performance_report(self.results, time.monotonic() - self.started_at,
+                                                      self.throttle.report() if self.throttle else None)
+        print(format_performance_report(performance_report))
 
         done_count = 0
-        for edit in self.edits:
-            if edit.success:
+        skipped_count = 0
+        for result in self.results:
+            if result.success:
                 done_count += 1
+            elif result.skipped:
+                skipped_count += 1
+
+        if self.dry_run_output:
+            print(f'Dry run finished: {done_count} of {self.created_count} edits written and {skipped_count} skipped,',
+                  'see', self.dry_run_output.index_path)
+            return
+        if is_debugging():
+            return
+        if is_local_site_enabled():
+            self.finish_local_execution(performance_report)
+            return
+
+        new_history_entry(amount_ordered=self.created_count, amount_done=done_count, amount_skipped=skipped_count,
+                          operator_name=self.operator,
+                          reference_summary=self.reference_summary, public_summary=self.public_summary,
+                          edit_durations=[result.duration for result in self.results],
+                          performance=performance_report)
+
+    def finish_local_execution(self, performance_report: dict):
+        """Writes the pages, edits included, and the performance of the execution against the local stand-in."""
+        site = get_site()
+        pages_path = local_output_path('pages.jsonl')
+        site.write_page_set(pages_path)
+        report_path = local_output_path('report.json')
+        with open(report_path, 'w') as file:
+            json.dump({'performance': performance_report, 'site': site.statistics()}, file, indent=2)
 
-        new_history_entry(amount_ordered=self.current_id - 1, amount_done=done_count, operator_name=self.operator,
-                          reference_summary=self.reference_summary, public_summary=self.public_summary)
+        print('Local site:', ', '.join(f'{value} {name}' for name, value in site.statistics().items()))
+        print('Pages written to', pages_path, 'and performance report to', report_path)
@@ -0,0 +1,69 @@
+"""
+Fingerprints of the values and ranks last published for each municipality, keyed by IBGE code. An execution only edits
+the cities whose fingerprint changed since their last finished edit, so yearly refreshes and reruns after a partial
+failure leave the up to date articles alone. Run main.py with --full to edit every selected city anyway, such as after
+changing what perform() writes without changing the data.
+
+Like the journal, the file is appended to as soon as each outcome is known, and compacted when the execution finishes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Iterable
+from journal import open_for_appending
+
+PUBLISHED_VALUES_PATH = 'published_values.jsonl'
+
+
+def city_fingerprint(data: dict, context: Iterable = ()) -> str:
+    """Digest of the data of a city, as made by make_cities_dict, along with whatever else the edit publishes (such
+    as the references), so a new reference also counts as a change."""
+    content = json.dumps([list(context), data], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class PublishedValues:
+    def __init__(self, path: str = PUBLISHED_VALUES_PATH, read_only: bool = False):
+        """A read-only store filters the cities but never records anything, as dry runs and debug mode do not
+        publish."""
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.fingerprints = {}  # IBGE code -> fingerprint
+
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line may have been cut by a crash
+                    self.fingerprints[entry['code']] = entry['fingerprint']
+
+        self.file = None if read_only else open_for_appending(path)
+
+    def outdated(self, fingerprints: dict[str, str]) -> set[str]:
+        """Returns the codes, out of the {code: new fingerprint} dict, whose published values differ."""
+        return {code for code, fingerprint in fingerprints.items() if self.fingerprints.get(code) != fingerprint}
+
+    def record(self, code: str, fingerprint: str):
+        if self.read_only:
+            return
+        with self.lock:
+            self.fingerprints[code] = fingerprint
+            self.file.write(json.dumps({'code': code, 'fingerprint': fingerprint}) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """Rewrites the file with only the latest fingerprint of each city."""
+        if self.read_only:
+            return
+        self.file.close()
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            for code, fingerprint in sorted(self.fingerprints.items()):
+                file.write(json.dumps({'code': code, 'fingerprint': fingerprint}) + '\n')
+        os.replace(temporary_path, self.path)
@@ -1,3 +1,4 @@
+import unicodedata
 from datetime import date
 
 states = {
@@ -30,11 +31,29 @@ states = {
     'TO': 'Tocantins'
 }
 
+# preposition used before each state name, as in "Lista de municípios do Acre por população"
+state_prepositions = {
+    'AC': 'do', 'AL': 'de', 'AP': 'do', 'AM': 'do', 'BA': 'da', 'CE': 'do', 'DF': 'do', 'ES': 'do', 'GO': 'de',
+    'MA': 'do', 'MT': 'de', 'MS': 'de', 'MG': 'de', 'PA': 'do', 'PB': 'da', 'PR': 'do', 'PE': 'de', 'PI': 'do',
+    'RJ': 'do', 'RN': 'do', 'RS': 'do', 'RO': 'de', 'RR': 'de', 'SC': 'de', 'SP': 'de', 'SE': 'de', 'TO': 'do'
+}
+
 
 def get_state_name_by_acronym(acronym: str):
     return states[acronym]
 
 
+def get_state_name_with_preposition(acronym: str):
+    return f'{state_prepositions[acronym]} {states[acronym]}'
+
+
+def normalize_city_name(city_name: str):
+    """Lowercase name with hyphens instead of spaces and without accents and other letter marks, as in the addresses of
+    the IBGE pages (São José do Rio Preto -> sao-jose-do-rio-preto)."""
+    link = city_name.strip().lower().replace(' ', '-')
+    return unicodedata.normalize('NFKD', link).encode('ASCII', 'ignore').decode('ASCII')
+
+
 def get_state_acronym_by_name(name: str):
     keys = list(states.keys())
     return keys.index(name)
@@ -1,58 +1,131 @@
+"""
+Record of every execution of the bot. Each execution appends one JSON line to history.jsonl, which costs the same no
+matter how long the history is. history.txt is only a human-readable view of that log, rendered by running this
+module (python src/history.py, from the repository root).
+"""
+
+import json
+import os
 from datetime import datetime
 from general_utils import generate_access_date
 
 AMOUNT_OF_DIGITS_FOR_HISTORY_ENTRY_ID = 5
-
-with open('history.txt', 'r') as file:
-    current_history = file.read()
+HISTORY_LOG_PATH = 'history.jsonl'
+HISTORY_VIEW_PATH = 'history.txt'
+HISTORY_VIEW_HEADER = 'Este arquivo serve para guardar registros de todas as execuções do Atualizador-cidades-bot.\n' \
+                      'Por favor, NÃO o modifique manualmente, o programa cuidará de todas as alterações.\n' \
+                      'Os registros estão postados em ordem cronológica decrescente (mais recentes por cima).\n\n' \
+                      + 120 * '-' + '\n'
 
 
 def new_history_entry(amount_ordered: int, amount_done: int, operator_name: str, reference_summary: str,
-                      public_summary: str):
-
-    entry_id = get_new_id()
+                      public_summary: str, amount_skipped: int = 0, edit_durations: list[float] = None,
+                      performance: dict = None) -> dict:
     now = datetime.now()
     timezone = 'GMT ' + datetime.now().astimezone().tzinfo.tzname(datetime.now().astimezone())
-    time_annotation = generate_access_date() + f' {now.hour}:{now.minute} ({timezone})'
-    percent_done = to_percentage(amount_done / amount_ordered)
-    percent_failed = to_percentage((amount_ordered - amount_done) / amount_ordered)
 
-    text = f'[{entry_id}] @ {time_annotation}\n' \
-           + f'Edições encomendadas: {amount_ordered}\n' \
-           + f'Edições concluídas: {amount_done} ({percent_done})\n' \
-           + f'Edições fracassadas: {amount_ordered - amount_done} ({percent_failed})\n' \
-           + f'Comentário interno: {reference_summary}\n' \
-           + f'Descrição pública da edição: {public_summary}\n' \
-           + f'Operador: {operator_name}\n'
+    entry = {
+        'id': get_new_id(),
+        'timestamp': now.astimezone().isoformat(timespec='seconds'),
+        'time_annotation': generate_access_date() + f' {now.hour}:{now.minute} ({timezone})',
+        'ordered': amount_ordered,
+        'done': amount_done,
+        'skipped': amount_skipped,
+        'failed': amount_ordered - amount_done - amount_skipped,
+        'reference_summary': reference_summary,
+        'public_summary': public_summary,
+        'operator': operator_name,
+        'edit_timings': aggregate_durations(edit_durations or []),
+        'performance': performance or {}
+    }
+
+    with open(HISTORY_LOG_PATH, 'a') as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    return entry
+
+
+def aggregate_durations(durations: list[float]) -> dict:
+    if not durations:
+        return {'count': 0}
+    return {
+        'count': len(durations),
+        'total': round(sum(durations), 3),
+        'mean': round(sum(durations) / len(durations), 3),
+        'max': round(max(durations), 3)
+    }
+
+
+def to_percentage(amount: int, total: int):
+    # executions where every city was already up to date order no edits at all
+    f = amount / total * 100 if total else 0
+    return f'{f:.0f}%'
 
-    insert_into_file_and_write(text)
 
+def get_new_id() -> int:
+    last_entry = read_last_entry()
 
-def to_percentage(f: float):
-    f *= 100
-    return f'{f:.0f}%'
+    # no logs in history
+    if not last_entry:
+        return 1
 
+    return last_entry['id'] + 1
 
-def get_new_id():
-    start_index = current_history.find('[') + 1
-    end_index = current_history.find(']')
 
-    # no logs in history
-    if start_index == 0:
-        return '00001'
+def read_last_entry():
+    """Reads only the end of the log, so it does not matter how many entries there are."""
+    if not os.path.exists(HISTORY_LOG_PATH):
+        return None
+
+    with open(HISTORY_LOG_PATH, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        tail = b''
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+            lines = tail.strip().split(b'\n')
+            if len(lines) > 1 or position == 0:
+                return json.loads(lines[-1]) if lines[-1] else None
+
+    return None
+
+
+def render_entry(entry: dict):
+    entry_id = str(entry['id']).zfill(AMOUNT_OF_DIGITS_FOR_HISTORY_ENTRY_ID)
+    amount_ordered = entry['ordered']
+    percent_done = to_percentage(entry['done'], amount_ordered)
+    percent_failed = to_percentage(entry['failed'], amount_ordered)
+
+    text = f'[{entry_id}] @ {entry["time_annotation"]}\n' \
+           + f'Edições encomendadas: {amount_ordered}\n' \
+           + f'Edições concluídas: {entry["done"]} ({percent_done})\n'
+    if entry.get('skipped') is not None:  # the oldest entries were written before skipping was possible
+        text += f'Edições ignoradas (já atualizadas): {entry["skipped"]} ' \
+                f'({to_percentage(entry["skipped"], amount_ordered)})\n'
+    text += f'Edições fracassadas: {entry["failed"]} ({percent_failed})\n' \
+            + f'Comentário interno: {entry["reference_summary"]}\n' \
+            + f'Descrição pública da edição: {entry["public_summary"]}\n' \
+            + f'Operador: {entry["operator"]}\n'
+    for note in entry.get('notes', ()):
+        text += note + '\n'
+
+    return text
+
 
-    num_index = int(current_history[start_index:end_index])
-    new_index = str(num_index + 1).zfill(AMOUNT_OF_DIGITS_FOR_HISTORY_ENTRY_ID)
-    return new_index
+def render_history_view():
+    """Writes history.txt from the log, with the most recent entries first."""
+    with open(HISTORY_LOG_PATH, 'r') as file:
+        entries = [json.loads(line) for line in file if line.strip()]
 
+    text = HISTORY_VIEW_HEADER
+    for entry in reversed(entries):
+        text += render_entry(entry) + '\n'
 
-def insert_into_file_and_write(new_entry_text: str):
-    # end of header is marked with 120 traces in a row
-    end_of_header_index = current_history.find(120 * '-') + 120
+    with open(HISTORY_VIEW_PATH, 'wt') as file:
+        file.write(text + '\n')
 
-    header_slice = current_history[:end_of_header_index + 1]
-    previous_entries_slice = current_history[end_of_header_index + 1:]
-    entire_text = header_slice + new_entry_text + '\n' + previous_entries_slice
 
-    with open('history.txt', 'wt') as file:
-        file.write(entire_text)
+if __name__ == '__main__':
+    render_history_view()
@@ -0,0 +1,122 @@
+"""
+Declarative definition of the indicators published in the infoboxes. Each indicator names the dataset it comes from
+(parsed as the schemas of dataset_store.py declare), the Infobox method that publishes it and, for the ranked ones, the
+RankableField and the sort direction. Its year and reference come from the job (see job.py).
+
+One engine computes every indicator: each dataset is read once, and a single pass over its rows collects the values of
+all of its indicators for the whole country, keyed by IBGE code, before each ranking is sorted once. So a new indicator
+is just a new entry of INDICATORS, and costs no extra work per city.
+"""
+
+from functools import cache
+from typing import Callable, NamedTuple, Optional
+from dataset_store import DATASETS, load_datasets, read_dataset
+from general_utils import get_state_name_with_preposition
+from infobox import Infobox, RankableField
+from municipality_registry import get_registry
+from ranking import Ranking
+
+
+class Indicator(NamedTuple):
+    name: str  # key of the value in the data of a city, and of its year and reference in the job files
+    dataset: str
+    field: str  # value column of the dataset
+    edit_method: str  # method of Infobox that publishes the value
+    takes_year: bool = True
+    takes_reference: bool = True
+    ranking: Optional[RankableField] = None
+    descending: bool = True  # whether the highest value ranks first
+    state_ranking_topic: Optional[str] = None  # the indicator in the name of the ranking articles, see ranking_articles
+    country_ranking_topic: Optional[str] = None
+    report_missing: bool = True  # whether a city missing from the dataset is reported (see municipality_registry.py)
+
+
+INDICATORS = (
+    Indicator('population', 'population', 'population', 'edit_population', ranking=RankableField.POPULATION,
+              state_ranking_topic='população', country_ranking_topic='população'),
+    Indicator('area', 'municipality_info', 'area', 'edit_area', takes_year=False),
+    Indicator('igp_per_capita', 'municipality_info', 'igp_per_capita', 'edit_igp_per_capita', takes_reference=False),
+    Indicator('hdi', 'municipality_info', 'hdi', 'edit_hdi', ranking=RankableField.HDI,  # some cities don't have HDI
+              state_ranking_topic='IDH-M', country_ranking_topic='IDH'),
+    Indicator('igp', 'igp', 'igp', 'edit_igp', ranking=RankableField.IGP,
+              state_ranking_topic='PIB', country_ranking_topic='PIB'),
+    # the table is from the 2010 census, so the municipalities created after it are not there
+    Indicator('gini', 'gini', 'gini', 'edit_gini', ranking=RankableField.GINI, descending=False,
+              report_missing=False),
+)
+
+
+@cache
+def compute_indicators(indicators: tuple[Indicator, ...] = INDICATORS) -> dict[str, dict]:
+    """Values and ranks of the indicators for every municipality of the country, keyed by IBGE code, formatted as
+    {'population': ..., 'population_rank_br': ..., 'population_rank_state': ..., ...}. The ranks include every row of
+    the tables, even the ones that match no municipality. Computed once per execution."""
+    datasets = list(dict.fromkeys(indicator.dataset for indicator in indicators))
+    load_datasets(*datasets)  # so the tables that changed are parsed in parallel
+    registry = get_registry()
+    values_by_code = {}
+
+    for dataset in datasets:
+        dataset_indicators = [indicator for indicator in indicators if indicator.dataset == dataset]
+        value_columns = DATASETS[dataset][0]
+        code_position = 2 + value_columns.index('code') if 'code' in value_columns else None
+        positions = [2 + value_columns.index(indicator.field) for indicator in dataset_indicators]
+        ranked_rows = {indicator.name: [] for indicator in dataset_indicators if indicator.ranking}
+        matched = []  # (state, code) of the rows that match a municipality
+
+        for index, (code, row) in enumerate(registry.match(dataset, read_dataset(dataset), code_position)):
+            state = row[0]
+            values = values_by_code.setdefault(code, {}) if code else {}
+            for indicator, position in zip(dataset_indicators, positions):
+                values[indicator.name] = row[position]
+                if indicator.ranking:
+                    ranked_rows[indicator.name].append((state, code or index, row[position]))
+            if code:
+                matched.append((state, code))
+
+        for indicator in dataset_indicators:
+            if not indicator.ranking:
+                continue
+            ranking = Ranking(ranked_rows[indicator.name], descending=indicator.descending)
+            for state, code in matched:
+                values = values_by_code[code]
+                if values[indicator.name] is not None:
+                    values[f'{indicator.name}_rank_br'] = ranking.national_position(state, code)
+                    values[f'{indicator.name}_rank_state'] = ranking.state_position(state, code)
+
+    return values_by_code
+
+
+def apply_indicators(infobox: Infobox, state: str, data: dict, years: dict[str, int],
+                     reference_for: Callable[[str], Optional[str]], indicators: tuple[Indicator, ...] = INDICATORS):
+    """Publishes the indicators of the city, and their ranks, in its infobox. The indicators that take a year are only
+    published when years has one for them, and the ones the city has no value for are left as they are.
+    reference_for(indicator name) returns the reference of the indicator for the city."""
+    for indicator in indicators:
+        if indicator.takes_year and indicator.name not in years:
+            continue
+        value = data.get(indicator.name)
+        if value is None:
+            continue
+
+        arguments = (value, years[indicator.name]) if indicator.takes_year else (value,)
+        keyword_arguments = {'reference': reference_for(indicator.name)} if indicator.takes_reference else {}
+        getattr(infobox, indicator.edit_method)(*arguments, **keyword_arguments)
+
+        rank_br = data.get(f'{indicator.name}_rank_br')
+        rank_state = data.get(f'{indicator.name}_rank_state')
+        if indicator.ranking and rank_br and rank_state:
+            state_article, country_article = ranking_articles(indicator, state)
+            infobox.edit_ranking_field(ranking=indicator.ranking, pos_in_state=rank_state, pos_in_country=rank_br,
+                                       state_complete_ranking_article_name=state_article,
+                                       country_complete_ranking_article_name=country_article, state=state)
+
+
+def ranking_articles(indicator: Indicator, state_acronym: str) -> tuple[Optional[str], Optional[str]]:
+    """Names of the articles that rank the municipalities of the state and of the country by the indicator, such as
+    "Lista de municípios do Acre por população", or None when there is no such article."""
+    state_article = f'Lista de municípios {get_state_name_with_preposition(state_acronym)} por ' \
+                    f'{indicator.state_ranking_topic}' if indicator.state_ranking_topic else None
+    country_article = f'Lista de municípios do Brasil por {indicator.country_ranking_topic}' \
+        if indicator.country_ranking_topic else None
+    return state_article, country_article
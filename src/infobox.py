@@ -1,9 +1,17 @@
-import pywikibot
+import functools
 import logging
+import mwparserfromhell
+import re
+from mwparserfromhell.nodes import Comment, Template, Text
+from mwparserfromhell.wikicode import Wikicode
 from enum import StrEnum
-from typing import Union
-from reference_guard import extract_refname
+from typing import TYPE_CHECKING, Optional, Union
+from reference_guard import ReferenceUsage, build_reference_index, reallocate_removed_references
 
+if TYPE_CHECKING:
+    import pywikibot
+
+INFOBOX_TEMPLATE_NAME = 'Info/Município do Brasil'
 INFOBOX_FIELDS_IN_ORDER = ('nome', 'nome_oficial', 'preposição', 'foto', 'leg_foto', 'oculta bandeira', 'bandeira',
                            'oculta brasão', 'brasão', 'link_bandeira', 'link_brasão', 'oculta hino', 'link_hino',
                            'lema', 'gentílico', 'mapa', 'esconde_estado', 'posição', 'latP', 'latG', 'latM', 'latS',
@@ -21,6 +29,8 @@ DEPRECATED_INFOBOX_FIELDS = ('apelido', 'aniversário', 'microrregião', 'data_m
                              'data_mesorregião', 'região_intermediária', 'data_região_intermediária', 'região_imediata',
                              'data_região_imediata', 'padroeiro', 'área_pos')
 
+ACCESS_DATE_PATTERN = re.compile(r'\|\s*acessodata\s*=[^|}]*')
+
 
 class RankableField(StrEnum):
     POPULATION = 'população_pos'
@@ -29,28 +39,47 @@ class RankableField(StrEnum):
     IGP = 'pib_pos'
 
 
+def recorded(method):
+    """Records every call of an edit method in the operations of the infobox, so the same edit can be replayed on a
+    newer revision of the article (see Infobox.replay)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.operations.append((method.__name__, args, kwargs))
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Infobox:
-    def __init__(self, article: pywikibot.Page):
+    def __init__(self, article: 'pywikibot.Page'):
+        """Parses the article once. The infobox template node is kept, so the new infobox can later be spliced
+        exactly where the old one was."""
         self.article = article
         self.fields = {}
-        template_with_args = None
-        for template in article.templatesWithParams():
-            if template[0].title() == 'Predefinição:Info/Município do Brasil':
-                template_with_args = template
-                break
+        self.wikicode = mwparserfromhell.parse(article.text)
+        self.node = find_infobox_template(self.wikicode)
 
-        if not template_with_args:
+        if not self.node:
             raise Exception('Could not find info template in given article.')
 
-        args_string = template_with_args[1]
-        for fieldstring in args_string:
-            try:
-                field, value = fieldstring.split('=', 1)
-                self.fields[field] = value
-
+        for param in self.node.params:
             # unexpected field format
-            except ValueError:
+            if not param.showkey:
                 continue
+            value = ''.join(str(node) for node in param.value.nodes if not isinstance(node, Comment))
+            self.fields[str(param.name).strip()] = value.strip()
+
+        self.original_fields = dict(self.fields)
+        self.removed_references = {}  # refname -> body of named references removed by the edit
+        self._reference_index = None
+        self.operations = []  # (method name, args, kwargs) of every edit method called, in order
+
+    def render_article(self) -> str:
+        """Replaces the infobox node by the newly generated infobox and returns the source of the whole article, with
+        the bodies of removed named references moved to their next usages."""
+        new_node = Text(self.generate_raw())
+        self.wikicode.replace(self.node, new_node)
+        self.node = new_node
+        return reallocate_removed_references(str(self.wikicode), self.removed_references)
 
     def _set_field(self, field_name: str, field_value: str):
         self.fields[field_name] = field_value
@@ -59,6 +88,7 @@ class Infobox:
         if self.fields.get(field_name) is not None:
             del self.fields[field_name]
 
+    @recorded
     def edit_hdi(self, hdi, year, reference: str = None):
         self._check_and_warn_for_named_references('idh_ref')
 
@@ -67,6 +97,7 @@ class Infobox:
         self._set_field('idh_ref', reference if reference else '')
         self._clear_field('idh_data')
 
+    @recorded
     def edit_gini(self, gini: float, year, reference: str = None):
         self._check_and_warn_for_named_references('gini_ref')
 
@@ -75,6 +106,7 @@ class Infobox:
         self._set_field('gini_ref', reference if reference else '')
         self._clear_field('gini_data')
 
+    @recorded
     def edit_population(self, population, year, reference: str = None):
         self._check_and_warn_for_named_references('população_ref')
 
@@ -84,6 +116,7 @@ class Infobox:
         self._clear_field('pop_data')
         self._clear_field('população_data')
 
+    @recorded
     def edit_ranking_field(self, ranking: RankableField, pos_in_state: int = None, state: str = None,
                            state_complete_ranking_article_name: str = None, pos_in_country: int = None,
                            country_complete_ranking_article_name: str = None):
@@ -102,12 +135,14 @@ class Infobox:
 
         self._set_field(ranking, field_value)
 
+    @recorded
     def edit_area(self, area: float, reference: str = None):
         self._check_and_warn_for_named_references('área_ref')
 
         self._set_field('área', str(area))
         self._set_field('área_ref', reference if reference else '')
 
+    @recorded
     def edit_igp(self, igp: float, year, reference: str = None):
         """IGP in BRL. Do not pass it as a one thousand factor."""
         self._check_and_warn_for_named_references('pib_ref')
@@ -118,11 +153,17 @@ class Infobox:
         self._set_field('pib_ref', reference if reference else '')
         self._clear_field('pib_data')
 
+    @recorded
     def edit_igp_per_capita(self, igp_per_capita: float, year: int):
         self._set_field('pib_per_capita', str(igp_per_capita))
         self._set_field('data_pib_per_capita', str(year))
         self._clear_field('pib_per_capita_data')
 
+    def replay(self, operations: list[tuple[str, tuple, dict]]):
+        """Repeats the edit operations recorded by another infobox of the same city."""
+        for method_name, args, kwargs in operations:
+            getattr(self, method_name)(*args, **kwargs)
+
     def generate_raw(self):
         params = sorted(self.fields.items(), key=infobox_field_sorting_function)
 
@@ -135,21 +176,60 @@ class Infobox:
         raw += '}}'
         return raw
 
+    def changed_fields(self) -> set[str]:
+        """Returns the fields whose values differ from the ones parsed from the article. Reference fields that only
+        differ in their access date are not considered changed."""
+        field_names = self.fields.keys() | self.original_fields.keys()
+        return {field for field in field_names
+                if comparable_value(self.fields.get(field)) != comparable_value(self.original_fields.get(field))}
+
     def _check_and_warn_for_named_references(self, ref_field: str):
-        """Checks if the field already contained a named reference and warns the operator that it may have caused a
-        break in the article."""
+        """Checks if the field already contained named references that are reused somewhere else in the article. Their
+        bodies are kept, so render_article can move them to their next usage instead of leaving them broken."""
         ref_content = self.fields.get(ref_field)
-        if ref_content and 'name' in ref_content:
-            refname = extract_refname(ref_content)
+        if not (ref_content and 'name' in ref_content):
+            return
 
-            # could not extract the reference name, or we have found this reference name multiple times in the article
-            # raw, so we have to check if it is broken
-            if (not refname) or self.article.text.count(refname) > 1:
-                logging.warning(f'Attention! Named reference replaced while editing {self.article.title()} '
-                                f'({self.article.full_url()}). Check for possible break.')
-            else:
+        field_references = build_reference_index(ref_content)
+        if not field_references:
+            logging.warning(f'Attention! Named reference replaced while editing {self.article.title()} '
+                            f'({self.article.full_url()}), but its name could not be read. Check for possible break.')
+
+        for refname, usages in field_references.items():
+            body = next((usage.body for usage in usages if usage.body), None)
+            if len(self.get_reference_index().get(refname, ())) <= len(usages):
                 logging.info(f'Removed previous named reference at {self.article.title()} ({self.article.full_url()}), '
                              f'but no other use of it was found.')
+            elif body:
+                self.removed_references[refname] = body
+                logging.info(f'Named reference "{refname}" replaced at {self.article.title()} '
+                             f'({self.article.full_url()}). Its body will be moved to its next usage.')
+            else:
+                logging.warning(f'Attention! Named reference replaced while editing {self.article.title()} '
+                                f'({self.article.full_url()}). Check for possible break.')
+
+    def get_reference_index(self) -> dict[str, list[ReferenceUsage]]:
+        """Named references of the original article. Built once, on first use."""
+        if self._reference_index is None:
+            self._reference_index = build_reference_index(self.article.text)
+        return self._reference_index
+
+
+def find_infobox_template(wikicode: Wikicode) -> Optional[Template]:
+    for template in wikicode.ifilter_templates():
+        name = str(template.name).strip().replace('_', ' ')
+        name = name.removeprefix('Predefinição:').removeprefix('Template:')
+        if name[:1].upper() + name[1:] == INFOBOX_TEMPLATE_NAME:
+            return template
+    return None
+
+
+def comparable_value(value: str):
+    """Field value without surrounding spaces and without the access date of the references it contains, which
+    changes every day even when the cited data did not."""
+    if value is None:
+        return None
+    return ACCESS_DATE_PATTERN.sub('', value).strip()
 
 
 def infobox_field_sorting_function(field_value_pair: tuple):
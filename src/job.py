@@ -0,0 +1,203 @@
+"""
+Job files: everything an execution needs to know, declared in a TOML or JSON file instead of typed at the terminal or
+changed in the code. A job declares who runs it and its summaries, the states and cities to be edited, the year of each
+published indicator (see indicators.py) and the references. Every job given to main.py is validated before the first
+one starts, so a queue of long unattended runs never stops halfway because of a typo. See jobs/exemplo.toml.
+"""
+
+import json
+import os
+import tomllib
+from datetime import date
+from typing import NamedTuple, Optional
+from dataset_store import DATASETS
+from general_utils import make_reference, states
+from indicators import INDICATORS
+
+ALL_STATES_KEYWORD = 'all'
+YEAR_FIELDS = tuple(indicator.name for indicator in INDICATORS if indicator.takes_year)
+REFERENCE_FIELDS = tuple(indicator.name for indicator in INDICATORS if indicator.takes_reference)
+REFERENCE_PLACEHOLDERS = ('state', 'city')  # lowercase state acronym and city name as in the links of IBGE
+FIRST_YEAR = 1872  # first census of Brazil
+DEFAULT_EDITS_PER_MINUTE = 6
+DEFAULT_MAX_EDITS_PER_MINUTE = 12
+
+
+class JobFileError(Exception):
+    def __init__(self, path: str, problems: list[str]):
+        self.path = path
+        self.problems = problems
+        super().__init__(f'Invalid job file {path}:\n' + '\n'.join(f'  - {problem}' for problem in problems))
+
+
+class ReferenceDefinition(NamedTuple):
+    name: str
+    link: str
+    title: str
+    publisher: str
+    year: int
+
+    def render(self, **placeholders) -> str:
+        """Full reference, with the placeholders of the link (see REFERENCE_PLACEHOLDERS) filled in."""
+        return make_reference(refname=self.name, link=self.link.format(**placeholders), title=self.title,
+                              publisher=self.publisher, year=self.year)
+
+    def is_per_city(self) -> bool:
+        return any(f'{{{placeholder}}}' in self.link for placeholder in REFERENCE_PLACEHOLDERS)
+
+
+class Job(NamedTuple):
+    path: str
+    operator: str
+    reference_summary: str
+    summary: str
+    states: tuple[str, ...]
+    start: int
+    amount: Optional[int]  # every city of the state from start on when None
+    years: dict[str, int]
+    references: dict[str, ReferenceDefinition]
+    edits_per_minute: float
+    max_edits_per_minute: float
+
+    def select(self, cities: list) -> list:
+        """The selected part of the cities of a state."""
+        return cities[self.start:] if self.amount is None else cities[self.start:self.start + self.amount]
+
+    def describe(self) -> str:
+        selection = f'cities {self.start + 1} to {self.start + self.amount}' if self.amount is not None \
+            else f'cities {self.start + 1} onwards'
+        return (f'Job {self.path}, run by {self.operator}: {selection} of {", ".join(self.states)}.\n'
+                f'Description: {self.reference_summary}\nEdit summary: {self.summary}')
+
+
+def read_job_file(path: str) -> dict:
+    with open(path, 'rb') as file:
+        if path.endswith('.toml'):
+            return tomllib.load(file)
+        if path.endswith('.json'):
+            return json.load(file)
+    raise JobFileError(path, ['unknown format, use a .toml or .json file'])
+
+
+def load_job(path: str) -> Job:
+    """Reads and validates the job file. Raises JobFileError listing every problem found."""
+    try:
+        content = read_job_file(path)
+    except (OSError, ValueError) as error:  # JSONDecodeError and TOMLDecodeError are ValueErrors
+        raise JobFileError(path, [str(error)])
+    if not isinstance(content, dict):  # a JSON file may hold a list or a single value
+        raise JobFileError(path, ['the job must be a table of settings, such as a JSON object'])
+
+    problems = []
+
+    def text(key: str, table: dict = content, where: str = '') -> str:
+        value = table.get(key)
+        if not isinstance(value, str) or not value.strip():
+            problems.append(f'{where}{key} must be a non-empty text')
+            return ''
+        return value.strip()
+
+    def integer(key: str, table: dict, where: str, minimum: int, maximum: int = None) -> Optional[int]:
+        value = table.get(key)
+        if not isinstance(value, int) or isinstance(value, bool) or value < minimum \
+                or (maximum is not None and value > maximum):
+            bounds = f'from {minimum} to {maximum}' if maximum is not None else f'of at least {minimum}'
+            problems.append(f'{where}{key} must be a whole number {bounds}, not {value!r}')
+            return None
+        return value
+
+    def section(key: str, required: bool = True) -> dict:
+        value = content.get(key, None if required else {})
+        if not isinstance(value, dict):
+            problems.append(f'[{key}] must be a table')
+            return {}
+        return value
+
+    def unknown_keys(found: dict, known, where: str):
+        for key in found.keys() - set(known):
+            problems.append(f'unknown setting {where}{key}')
+
+    unknown_keys(content, ('operator', 'reference_summary', 'summary', 'selection', 'years', 'references', 'saves'), '')
+    operator = text('operator')
+    reference_summary = text('reference_summary')
+    summary = text('summary')
+
+    selection = section('selection')
+    unknown_keys(selection, ('states', 'start', 'amount'), 'selection.')
+    target_states = selection.get('states')
+    if target_states == ALL_STATES_KEYWORD:
+        target_states = tuple(states)
+    elif isinstance(target_states, list) and target_states and all(isinstance(state, str) for state in target_states):
+        target_states = tuple(state.upper() for state in target_states)
+        for state in target_states:
+            if state not in states:
+                problems.append(f'selection.states: unknown state {state}')
+    else:
+        problems.append(f'selection.states must be a list of state acronyms or "{ALL_STATES_KEYWORD}"')
+        target_states = ()
+    start = integer('start', selection, 'selection.', 0) if 'start' in selection else 0
+    amount = integer('amount', selection, 'selection.', 1) if 'amount' in selection else None
+
+    years = section('years')  # only the indicators given a year are published, see apply_indicators
+    unknown_keys(years, YEAR_FIELDS, 'years.')
+    if not years:
+        problems.append('[years] must give the year of at least one of ' + ', '.join(YEAR_FIELDS))
+    for field in years:
+        integer(field, years, 'years.', FIRST_YEAR, date.today().year)
+
+    references = {}
+    reference_definitions = section('references', required=False)
+    unknown_keys(reference_definitions, REFERENCE_FIELDS, 'references.')
+    for field, definition in reference_definitions.items():
+        where = f'references.{field}.'
+        if not isinstance(definition, dict):
+            problems.append(f'[references.{field}] must be a table')
+            continue
+        unknown_keys(definition, ReferenceDefinition._fields, where)
+        reference = ReferenceDefinition(text('name', definition, where), text('link', definition, where),
+                                        text('title', definition, where), text('publisher', definition, where),
+                                        integer('year', definition, where, FIRST_YEAR, date.today().year))
+        try:
+            reference.link.format(**{placeholder: '' for placeholder in REFERENCE_PLACEHOLDERS})
+        except (KeyError, IndexError, ValueError):
+            problems.append(f'{where}link may only have the placeholders '
+                            + ', '.join(f'{{{placeholder}}}' for placeholder in REFERENCE_PLACEHOLDERS))
+        references[field] = reference
+    for indicator in INDICATORS:
+        # without a reference, the published value would replace the source of the article with nothing
+        if indicator.takes_reference and (indicator.name in years or not indicator.takes_year) \
+                and indicator.name not in reference_definitions:
+            problems.append(f'[references.{indicator.name}] is required, since {indicator.name} is published')
+
+    saves = section('saves', required=False)
+    unknown_keys(saves, ('edits_per_minute', 'max_edits_per_minute'), 'saves.')
+    edits_per_minute = saves.get('edits_per_minute', DEFAULT_EDITS_PER_MINUTE)
+    max_edits_per_minute = saves.get('max_edits_per_minute', DEFAULT_MAX_EDITS_PER_MINUTE)
+    if not all(isinstance(rate, (int, float)) and not isinstance(rate, bool) and rate > 0
+               for rate in (edits_per_minute, max_edits_per_minute)):
+        problems.append('saves.edits_per_minute and saves.max_edits_per_minute must be positive numbers')
+    elif 'max_edits_per_minute' not in saves:
+        max_edits_per_minute = max(max_edits_per_minute, edits_per_minute)
+    elif max_edits_per_minute < edits_per_minute:
+        problems.append('saves.max_edits_per_minute must not be lower than saves.edits_per_minute')
+
+    if problems:
+        raise JobFileError(path, problems)
+    return Job(path, operator, reference_summary, summary, target_states, start, amount, dict(years), references,
+               edits_per_minute, max_edits_per_minute)
+
+
+def load_jobs(paths: list[str]) -> list[Job]:
+    """Validates every job file, and the presence of the dataset files, before any of the jobs runs. Raises
+    JobFileError with the problems of all the files."""
+    jobs = []
+    problems = [f'dataset file {source} not found (run from the repository root)'
+                for _, _, sources in DATASETS.values() for source in sources if not os.path.exists(source)]
+    for path in paths:
+        try:
+            jobs.append(load_job(path))
+        except JobFileError as error:
+            problems.extend(f'{path}: {problem}' for problem in error.problems)
+    if problems:
+        raise JobFileError(', '.join(paths), problems)
+    return jobs
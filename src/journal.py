@@ -0,0 +1,72 @@
+"""
+Append-only journal of the outcome of every edit of an execution. Each outcome is written and fsync'd as soon as it is
+known, so the record of what was saved survives crashes and interruptions. Running main.py with --resume reads the
+journal of the interrupted execution and skips the cities it already finished.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+JOURNAL_PATH = 'run_journal.jsonl'
+FINISHED_STATUSES = ('done', 'skipped')
+
+
+def open_for_appending(path: str):
+    """Opens a JSON lines file for appending. If its last line was cut by a crash, a new line is started, so the next
+    entry is not glued to the broken one and lost with it."""
+    file = open(path, 'a')
+    if file.tell() > 0:
+        with open(path, 'rb') as existing:
+            existing.seek(-1, os.SEEK_END)
+            if existing.read() != b'\n':
+                file.write('\n')
+    return file
+
+
+class Journal:
+    def __init__(self, path: str = JOURNAL_PATH, resume: bool = False):
+        """A new execution starts a new journal. When resuming, the previous journal is read and extended."""
+        self.path = path
+        self.lock = threading.Lock()
+        self.finished_cities = set()
+        self.last_edit_id = 0
+
+        if resume and os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line may have been cut by the crash
+                    self.last_edit_id = max(self.last_edit_id, entry['id'])
+                    if entry['status'] in FINISHED_STATUSES:
+                        self.finished_cities.add((entry['city'], entry['state']))
+
+        self.file = open_for_appending(path) if resume else open(path, 'w')
+
+    def is_finished(self, city: str, state_name: str):
+        return (city, state_name) in self.finished_cities
+
+    def record(self, edit_id: int, city: str, state_name: str, title: str, status: str, revision_id: int = None,
+               timings: dict = None):
+        entry = {
+            'id': edit_id,
+            'city': city,
+            'state': state_name,
+            'title': title,
+            'status': status,
+            'revid': revision_id,
+            'timings': timings or {},
+            'time': datetime.now().isoformat(timespec='seconds')
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            if status in FINISHED_STATUSES:
+                self.finished_cities.add((city, state_name))
+
+    def close(self):
+        self.file.close()
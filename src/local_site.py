@@ -0,0 +1,257 @@
+"""
+Local stand-in for the parts of pywikibot.Site and pywikibot.Page used by the bot. The pages live in memory, so the
+lookup and edit code can be exercised without touching Wikipedia. It also counts the requests that a real site would
+have received.
+
+Usage: prefetch_city_articles(cities, wiki=LocalSite(pages), page_factory=LocalPage)
+
+The site can also serve a recorded page set from disk and simulate the conditions of the real one: latency of every
+request, a limit of edits per minute, replication lag, edit conflicts and failed saves. Setting LOCAL_SITE_PAGES in the
+.env file makes main.py run against such a site instead of Wikipedia (see LocalSite.from_environment), so whole batches
+can be executed and measured offline.
+"""
+
+import json
+import os
+import pywikibot
+import random
+import time
+from collections import deque
+from pywikibot import textlib
+from pywikibot.exceptions import APIError, EditConflictError, ServerError
+from throttle import MAXLAG
+
+LOCAL_SITE_OUTPUT_DIR = os.getenv('LOCAL_SITE_OUTPUT_DIR', 'local-site')
+RATE_LIMIT_WINDOW = 60  # seconds
+
+
+def is_local_site_enabled():
+    """Whether the execution runs against the local stand-in instead of Wikipedia."""
+    return bool(os.getenv('LOCAL_SITE_PAGES'))
+
+
+def local_output_path(file_name: str):
+    """Path of a file written by an execution against the local stand-in. They are kept apart from the files of
+    actual executions, so a simulated run never marks a city as done or caches a fake page id."""
+    os.makedirs(LOCAL_SITE_OUTPUT_DIR, exist_ok=True)
+    return os.path.join(LOCAL_SITE_OUTPUT_DIR, file_name)
+
+
+def load_page_set(path: str) -> list[dict]:
+    """Reads a recorded page set: a JSON lines file with one {"title": ..., "pageid": ..., "text": ...} object per
+    page. The page id is optional."""
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def write_page_set(path: str, pages: dict[str, str], page_ids: dict[str, int] = None):
+    page_ids = page_ids or {}
+    with open(path, 'w') as file:
+        for title, text in pages.items():
+            entry = {'title': title, 'pageid': page_ids.get(title), 'text': text}
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def record_page_set(path: str, titles: list[str], wiki=None):
+    """Downloads the current source of the pages from the real site and writes them as a page set. Pages that do not
+    exist are left out, just like they would be missing from the real site."""
+    wiki = wiki or pywikibot.Site('pt')
+    pages = [page for page in wiki.preloadpages([pywikibot.Page(wiki, title) for title in titles]) if page.exists()]
+    write_page_set(path, {page.title(): page.text for page in pages}, {page.title(): page.pageid for page in pages})
+
+
+class LocalSite:
+    def __init__(self, pages: dict[str, str] = None, latency: float = 0, edits_per_minute: float = None,
+                 conflict_rate: float = 0, failure_rate: float = 0, seed: int = None, lag_per_save: float = 0):
+        """Takes a dict mapping page titles to their sources. Every request waits the latency, in seconds. Saves beyond
+        edits_per_minute wait for the rate limit, as pywikibot waits when the API reports it. A fraction of the saves,
+        chosen at random, fails with an edit conflict (conflict_rate) or a server error (failure_rate).
+
+        Each save adds lag_per_save seconds to the replication lag, which drains at one second per second. While the
+        lag is above MAXLAG, saves are refused with a maxlag error, so saving faster than one edit per lag_per_save
+        seconds builds up lag just like a busy wiki."""
+        self.pages = dict(pages or {})
+        self.page_ids = {title: page_id for page_id, title in enumerate(self.pages, start=1)}
+        self.request_count = 0
+        self.last_revision_id = 0
+        self.latency = latency
+        self.edits_per_minute = edits_per_minute
+        self.conflict_rate = conflict_rate
+        self.failure_rate = failure_rate
+        self.randomizer = random.Random(seed)
+        self.recent_saves = deque()  # monotonic times of the saves inside the rate limit window
+        self.rate_limited_time = 0
+        self.conflict_count = 0
+        self.failure_count = 0
+        self.lag_per_save = lag_per_save
+        self.lag = 0
+        self.lag_measured_at = time.monotonic()
+        self.max_lag = 0
+        self.maxlag_count = 0
+
+    @classmethod
+    def from_page_set(cls, path: str, **settings):
+        """Site serving the recorded page set at the path (see load_page_set). Takes the same settings of __init__."""
+        entries = load_page_set(path)
+        site = cls({entry['title']: entry['text'] for entry in entries}, **settings)
+        site.page_ids.update({entry['title']: entry['pageid'] for entry in entries if entry.get('pageid')})
+        return site
+
+    @classmethod
+    def from_environment(cls):
+        """Site configured by the LOCAL_SITE_* environment variables. LOCAL_SITE_PAGES is the recorded page set, and
+        the others are optional: LOCAL_SITE_LATENCY (seconds), LOCAL_SITE_EDITS_PER_MINUTE, LOCAL_SITE_CONFLICT_RATE,
+        LOCAL_SITE_FAILURE_RATE (fractions of the saves), LOCAL_SITE_SEED and LOCAL_SITE_LAG_PER_SAVE (seconds)."""
+        edits_per_minute = os.getenv('LOCAL_SITE_EDITS_PER_MINUTE')
+        seed = os.getenv('LOCAL_SITE_SEED')
+        return cls.from_page_set(os.environ['LOCAL_SITE_PAGES'],
+                                 latency=float(os.getenv('LOCAL_SITE_LATENCY', '0')),
+                                 edits_per_minute=float(edits_per_minute) if edits_per_minute else None,
+                                 conflict_rate=float(os.getenv('LOCAL_SITE_CONFLICT_RATE', '0')),
+                                 failure_rate=float(os.getenv('LOCAL_SITE_FAILURE_RATE', '0')),
+                                 seed=int(seed) if seed else None,
+                                 lag_per_save=float(os.getenv('LOCAL_SITE_LAG_PER_SAVE', '0')))
+
+    def request(self):
+        self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def preloadpages(self, pages, groupsize: int = 50):
+        pages = list(pages)
+        for start in range(0, len(pages), groupsize):
+            self.request()
+            for page in pages[start:start + groupsize]:
+                page.load()
+                yield page
+
+    def page_source(self, title: str):
+        return self.pages.get(title)
+
+    def store_page(self, title: str, source: str):
+        if title not in self.page_ids:
+            self.page_ids[title] = max(self.page_ids.values(), default=0) + 1
+        self.pages[title] = source
+
+    def save_page(self, page: 'LocalPage'):
+        """Stores the page as the API would, or raises the error the API would have given."""
+        self.wait_for_rate_limit()
+        self.request()
+
+        lag = self.current_lag()
+        if lag > MAXLAG:
+            self.maxlag_count += 1
+            raise APIError('maxlag', f'Waiting for a database server: {lag:.1f} seconds lagged')
+        if self.randomizer.random() < self.conflict_rate:
+            self.conflict_count += 1
+            raise EditConflictError(page, f'Simulated edit conflict at {page.title()}')
+        if self.randomizer.random() < self.failure_rate:
+            self.failure_count += 1
+            raise ServerError(f'Simulated failure while saving {page.title()}')
+
+        self.store_page(page.title(), page.text)
+        self.lag += self.lag_per_save
+        self.max_lag = max(self.max_lag, self.lag)
+        self.last_revision_id += 1
+        return self.last_revision_id
+
+    def current_lag(self) -> float:
+        now = time.monotonic()
+        self.lag = max(0.0, self.lag - (now - self.lag_measured_at))
+        self.lag_measured_at = now
+        return self.lag
+
+    def replication_lag(self) -> float:
+        """Answers the query of the replication lag, as siteinfo's dbrepllag does."""
+        self.request()
+        return self.current_lag()
+
+    def wait_for_rate_limit(self):
+        if not self.edits_per_minute:
+            return
+
+        now = time.monotonic()
+        while self.recent_saves and now - self.recent_saves[0] >= RATE_LIMIT_WINDOW:
+            self.recent_saves.popleft()
+        if len(self.recent_saves) >= self.edits_per_minute:
+            wait = RATE_LIMIT_WINDOW - (now - self.recent_saves[0])
+            self.rate_limited_time += wait
+            time.sleep(wait)
+            self.recent_saves.popleft()
+        self.recent_saves.append(time.monotonic())
+
+    def write_page_set(self, path: str):
+        """Writes the current pages, edits included, so they can be served again by a later execution."""
+        write_page_set(path, self.pages, self.page_ids)
+
+    def statistics(self) -> dict:
+        return {
+            'requests': self.request_count,
+            'saves': self.last_revision_id,
+            'conflicts': self.conflict_count,
+            'failures': self.failure_count,
+            'maxlag_errors': self.maxlag_count,
+            'max_lag_seconds': round(self.max_lag, 3),
+            'rate_limited_seconds': round(self.rate_limited_time, 3)
+        }
+
+
+class LocalPage:
+    def __init__(self, site: LocalSite, title: str):
+        self.site = site
+        self._title = title
+        self._text = None
+        self._loaded = False
+
+    def load(self):
+        self._text = self.site.page_source(self._title)
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.site.request()
+            self.load()
+
+    @property
+    def text(self):
+        self._ensure_loaded()
+        return self._text or ''
+
+    @text.setter
+    def text(self, value: str):
+        self._ensure_loaded()
+        self._text = value
+
+    @property
+    def pageid(self):
+        self._ensure_loaded()
+        return self.site.page_ids.get(self._title, 0)
+
+    def exists(self):
+        return self.pageid > 0
+
+    def isRedirectPage(self):
+        return self.text.lstrip().upper().startswith(('#REDIRECIONAMENTO', '#REDIRECT'))
+
+    def title(self, as_link: bool = False):
+        return f'[[{self._title}]]' if as_link else self._title
+
+    def full_url(self):
+        return 'https://pt.wikipedia.org/wiki/' + self._title.replace(' ', '_')
+
+    def templatesWithParams(self):
+        templates = []
+        for name, params in textlib.extract_templates_and_params(self.text, True, True):
+            params = [f'{key}={value}' for key, value in params.items()]
+            templates.append((LocalPage(self.site, 'Predefinição:' + name), params))
+        return templates
+
+    def save(self, summary: str = None):
+        self.latest_revision_id = self.site.save_page(self)
+
+
+if __name__ == '__main__':
+    # records the articles of every city in the title cache: python src/local_site.py pages.jsonl
+    import sys
+    from title_cache import get_title_cache
+    record_page_set(sys.argv[1], sorted({entry['title'] for entry in get_title_cache().entries.values()}))
@@ -1,7 +1,44 @@
+import argparse
+import sys
 from dotenv import load_dotenv
-load_dotenv()
-from action import perform  # noqa: E402
-from edit import SerialEdits  # noqa: E402
 
-operation: SerialEdits = perform()
-operation.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description='Atualizador-cidades-bot')
+    parser.add_argument('jobs', nargs='*', metavar='JOB',
+                        help='job files (TOML or JSON) to be run one after another, see jobs/exemplo.toml')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the cities already finished by the interrupted execution of the first job, '
+                             'according to its journal')
+    parser.add_argument('--full', action='store_true',
+                        help='edit every selected city, even those whose values and ranks were already published')
+    parser.add_argument('--data-only', action='store_true',
+                        help='only compute and check the values and ranks of every city, without loading pywikibot')
+    arguments = parser.parse_args()
+
+    load_dotenv()
+
+    if arguments.data_only:
+        from data_check import check_data
+        sys.exit(1 if check_data() else 0)
+
+    if not arguments.jobs:
+        parser.error('give at least one job file, such as jobs/exemplo.toml')
+
+    from job import JobFileError, load_jobs
+
+    try:
+        jobs = load_jobs(arguments.jobs)  # all of them are checked before the first one starts
+    except JobFileError as error:
+        sys.exit(str(error))
+
+    from action import perform
+
+    for position, job in enumerate(jobs):
+        print(job.describe())
+        operation = perform(job, resume=arguments.resume and position == 0, full=arguments.full)
+        operation.finish()
+
+
+if __name__ == '__main__':  # the dataset store starts worker processes, which import this module on some platforms
+    main()
@@ -0,0 +1,87 @@
+"""
+National registry of the municipalities, keyed by their IBGE code. Besides the codes, the registry indexes the
+normalized name of every municipality in its state (see normalize_city_name), so the tables that only carry names,
+such as the PIB and Gini ones, are joined by code too.
+
+Rows that match no municipality, and municipalities missing from a table, are recorded and reported instead of being
+silently dropped.
+"""
+
+import logging
+from typing import Iterable, Iterator, NamedTuple, Optional
+from dataset_store import read_dataset
+from general_utils import normalize_city_name
+
+
+class Municipality(NamedTuple):
+    code: str
+    state: str
+    name: str
+
+
+class UnmatchedRow(NamedTuple):
+    dataset: str
+    state: str
+    city: str
+    reason: str
+
+
+class MunicipalityRegistry:
+    def __init__(self):
+        self.municipalities = {}  # code -> Municipality
+        self.codes_by_name = {}  # (state, normalized name) -> code
+        self.unmatched = []
+        self.reported = set()  # the rows of unmatched, so a table of mostly unmatched rows is still joined quickly
+
+    def add(self, code: str, state: str, name: str):
+        if code not in self.municipalities:
+            self.municipalities[code] = Municipality(code, state, name)
+        self.codes_by_name.setdefault((state, normalize_city_name(name)), code)
+
+    def find(self, state: str, name: str, code: str = None) -> Optional[str]:
+        """Returns the code of the municipality, looked up by its code when the row has one, or else by its name."""
+        if code in self.municipalities:
+            return code
+        return self.codes_by_name.get((state, normalize_city_name(name)))
+
+    def match(self, dataset: str, rows: Iterable[tuple], code_position: int = None) -> Iterator[tuple[str, tuple]]:
+        """Yields (code, row) for every (state, city, ...) row, in order. The code is None for the rows that match no
+        municipality, and for the repeated rows of a municipality, which are reported."""
+        seen = set()
+        for row in rows:
+            state, city = row[0], row[1]
+            code = self.find(state, city, row[code_position] if code_position is not None else None)
+            if code is None:
+                self.report(dataset, state, city, 'no municipality with this code or name')
+            elif code in seen:
+                self.report(dataset, state, city, f'another row of the table is also {self.municipalities[code].name}')
+                code = None
+            else:
+                seen.add(code)
+            yield code, row
+
+    def report(self, dataset: str, state: str, city: str, reason: str):
+        unmatched_row = UnmatchedRow(dataset, state, city, reason)
+        if unmatched_row not in self.reported:
+            self.reported.add(unmatched_row)
+            self.unmatched.append(unmatched_row)
+            logging.warning(f'Unmatched row of {dataset}: {city} ({state}), {reason}.')
+
+
+_registry = None
+
+
+def get_registry() -> MunicipalityRegistry:
+    """Registry built from the population table and the municipality information tables, which carry the codes."""
+    global _registry
+    if _registry is None:
+        _registry = MunicipalityRegistry()
+        for state, city, code, _ in read_dataset('population'):
+            if code:
+                _registry.add(code, state, city)
+            else:
+                _registry.report('population', state, city, 'no IBGE code')
+        for state, city, code, _, _, _ in read_dataset('municipality_info'):
+            if code:
+                _registry.add(code, state, city)
+    return _registry
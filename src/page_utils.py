@@ -1,42 +1,133 @@
 import pywikibot
+from local_site import LocalPage, LocalSite, is_local_site_enabled
+from title_cache import TitleCache, get_title_cache
 
-site = pywikibot.Site('pt')
+PREFETCH_GROUP_SIZE = 50  # maximum amount of titles the API accepts per request for regular accounts
+LAG_PROBE_MAXLAG = 24 * 60 * 60  # seconds, high enough that the lag probe itself is never refused
 
+_site = None
 
-def produce_new_raw(old_page_raw: str, infobox_raw: str):
-	start_index = old_page_raw.index('{{Info/Município do Brasil')
 
-	opened_brackets = 1
-	last_char = ''
-	final_index = start_index + 2
-	while True:
-		if old_page_raw[final_index] == last_char == '{':
-			opened_brackets += 1
+def get_site():
+	"""The site to be edited, created on first use: Wikipedia, or the local stand-in when LOCAL_SITE_PAGES is set
+	(see local_site.py). Creating it is left out of the imports, so starting the bot and working only with the data
+	never waits for pywikibot."""
+	global _site
+	if _site is None:
+		if is_local_site_enabled():
+			_site = LocalSite.from_environment()
+		else:
+			# siteinfo is kept in pywikibot's API cache for config.API_config_expiry days (30 unless the operator changed it)
+			_site = pywikibot.Site('pt')
+	return _site
 
-		elif old_page_raw[final_index] == last_char == '}':
-			opened_brackets -= 1
 
-		if not opened_brackets:
-			break
+def new_page(wiki, title: str):
+	"""Page of the site, of the class that matches it."""
+	if isinstance(wiki, LocalSite):
+		return LocalPage(wiki, title)
+	return pywikibot.Page(wiki, title)
 
-		final_index += 1
-		last_char = old_page_raw[final_index]
 
-	return old_page_raw[:start_index] + infobox_raw + old_page_raw[final_index + 2:]
+def replication_lag(wiki) -> float:
+	"""Current replication lag of the site, in seconds, as the maxlag parameter of the API measures it."""
+	if isinstance(wiki, LocalSite):
+		return wiki.replication_lag()
+	# pywikibot sends config.maxlag with every request, which would refuse this one exactly when the lag is high
+	response = wiki.simple_request(action='query', meta='siteinfo', siprop='dbrepllag',
+								   maxlag=LAG_PROBE_MAXLAG).submit()
+	return float(response['query']['dbrepllag'][0]['lag'])
 
 
-def find_city_article(city: str, state: str):
-	supposed_page = pywikibot.Page(site, city)
+def find_city_article(city: str, state: str, title_cache: TitleCache = None):
+	title_cache = title_cache or get_title_cache()
+	cached = title_cache.get(city, state)
+	if cached:
+		cached_page = new_page(get_site(), cached['title'])
+		if is_cached_article_valid(cached_page, cached):
+			return cached_page
+		title_cache.discard(city, state)
+
+	supposed_page = new_page(get_site(), city)
 
 	if is_disambiguation(supposed_page) or not is_city_article(supposed_page):
-		supposed_page = pywikibot.Page(site, city + f' ({state})')
+		supposed_page = new_page(get_site(), city + f' ({state})')
 
 	if not is_city_article(supposed_page):
+		title_cache.save()
 		raise Exception(f'Failed to find city: {city}, state: {state}')
 
+	title_cache.store(city, state, supposed_page)
+	title_cache.save()
 	return supposed_page
 
 
+def prefetch_city_articles(cities: list[tuple[str, str]], wiki=None, page_factory=None,
+						   title_cache: TitleCache = None):
+	"""Finds the articles of many cities at once, with the same rules of find_city_article, but loading the candidate
+	pages in batches instead of one request per page. Takes (city, state name) pairs and returns a dict mapping each
+	pair to its loaded page. Cities whose article could not be found are left out of the dict.
+
+	Cities found in the title cache have their cached article loaded directly, and are only probed again if that
+	article is no longer valid. The site and the page class can be replaced by a local stand-in (see local_site.py)."""
+	wiki = wiki or get_site()
+	page_factory = page_factory or new_page
+	title_cache = title_cache or get_title_cache()
+	articles = {}
+	pages_by_title = {}  # cities of different states may share the bare title, and each title is loaded only once
+
+	def get_page(title: str):
+		if title not in pages_by_title:
+			pages_by_title[title] = page_factory(wiki, title)
+		return pages_by_title[title]
+
+	cached_pages = {}
+	for city, state in cities:
+		cached = title_cache.get(city, state)
+		if cached:
+			cached_pages[(city, state)] = get_page(cached['title'])
+	preload_pages(wiki, cached_pages.values())
+
+	for (city, state), page in cached_pages.items():
+		if is_cached_article_valid(page, title_cache.get(city, state)):
+			articles[(city, state)] = page
+		else:
+			title_cache.discard(city, state)
+
+	bare_title_pages = {(city, state): get_page(city) for city, state in cities if (city, state) not in articles}
+	preload_pages(wiki, bare_title_pages.values())
+
+	state_title_pages = {}
+	for (city, state), page in bare_title_pages.items():
+		if not page.exists() or is_disambiguation(page) or not is_city_article(page):
+			state_title_pages[(city, state)] = get_page(city + f' ({state})')
+		else:
+			articles[(city, state)] = page
+			title_cache.store(city, state, page)
+	preload_pages(wiki, state_title_pages.values())
+
+	for (city, state), page in state_title_pages.items():
+		if page.exists() and is_city_article(page):
+			articles[(city, state)] = page
+			title_cache.store(city, state, page)
+
+	title_cache.save()
+	return articles
+
+
+def is_cached_article_valid(article: pywikibot.Page, cached: dict):
+	"""The cached article is only trusted if it was not moved or replaced and is still the article of a city."""
+	return article.exists() and not article.isRedirectPage() and article.pageid == cached['pageid'] \
+		and is_city_article(article)
+
+
+def preload_pages(wiki, pages):
+	"""Loads the content of the pages, PREFETCH_GROUP_SIZE titles per request."""
+	unique_pages = list(dict.fromkeys(pages))
+	for _ in wiki.preloadpages(unique_pages, groupsize=PREFETCH_GROUP_SIZE):
+		pass
+
+
 def unformat_article_text(article: pywikibot.Page):
 	return article.text.replace(' ', '')
 
@@ -0,0 +1,65 @@
+"""
+Per-stage latency report of an execution, so it is possible to tell where the time goes: finding the articles,
+parsing them, transforming the infobox, rendering the new source, waiting for the save budget or saving.
+"""
+
+import math
+
+STAGES_IN_ORDER = ('lookup', 'parse', 'transform', 'render', 'throttle', 'save')
+
+
+def percentile(sorted_values: list[float], percent: float):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def build_performance_report(edits: list, elapsed_seconds: float, throttle_report: dict = None) -> dict:
+    """Takes the edits of an execution (anything with timings, success and retries attributes), the wall-clock
+    time it took and, if the saves were paced, the report of the throttle (see throttle.py)."""
+    durations_by_stage = {}
+    for edit in edits:
+        for stage, duration in edit.timings.items():
+            durations_by_stage.setdefault(stage, []).append(duration)
+
+    stages = {}
+    known_stages = [stage for stage in STAGES_IN_ORDER if stage in durations_by_stage]
+    other_stages = sorted(stage for stage in durations_by_stage if stage not in STAGES_IN_ORDER)
+    for stage in known_stages + other_stages:
+        durations = sorted(durations_by_stage[stage])
+        stages[stage] = {
+            'count': len(durations),
+            'p50': round(percentile(durations, 50), 4),
+            'p95': round(percentile(durations, 95), 4),
+            'p99': round(percentile(durations, 99), 4),
+            'total': round(sum(durations), 3)
+        }
+
+    saved_count = sum(1 for edit in edits if edit.success)
+    report = {
+        'elapsed_seconds': round(elapsed_seconds, 3),
+        'edits_per_minute': round(saved_count / (elapsed_seconds / 60), 2) if elapsed_seconds else 0,
+        'retries': sum(edit.retries for edit in edits),
+        'stages': stages
+    }
+    if throttle_report:
+        report['throttle'] = throttle_report
+    return report
+
+
+def format_performance_report(report: dict) -> str:
+    lines = [f'Elapsed: {report["elapsed_seconds"]:.1f}s, {report["edits_per_minute"]} edits per minute, '
+             f'{report["retries"]} retries',
+             f'{"stage":<10} {"count":>6} {"p50 (s)":>9} {"p95 (s)":>9} {"p99 (s)":>9} {"total (s)":>10}']
+    for stage, numbers in report['stages'].items():
+        lines.append(f'{stage:<10} {numbers["count"]:>6} {numbers["p50"]:>9.4f} {numbers["p95"]:>9.4f} '
+                     f'{numbers["p99"]:>9.4f} {numbers["total"]:>10.3f}')
+
+    throttle = report.get('throttle')
+    if throttle:
+        backoffs = ', '.join(f'{count} {reason}' for reason, count in throttle['backoffs'].items()) or 'none'
+        achieved = f'{throttle["edits_per_minute"]} edits per minute achieved' \
+            if throttle['edits_per_minute'] is not None else f'{throttle["saves"]} saves, too few to measure the rate'
+        lines.append(f'Saves: {achieved}, ending at {throttle["final_rate"]} per minute; backoffs: {backoffs} '
+                     f'({throttle["backoff_seconds"]}s), max lag {throttle["max_lag_seen"]}s')
+    return '\n'.join(lines)
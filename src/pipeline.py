@@ -0,0 +1,200 @@
+"""
+Pipelined execution of a batch of edits. Fetching the articles, transforming their infoboxes and saving them run at
+the same time: the first two stages run in worker threads, and saving runs in the calling thread (so debug prompts
+and Ctrl+C keep working as before). The stages are connected by bounded queues, so a slow save stage holds the
+others back instead of piling up loaded articles in memory.
+
+Saving is paced by an adaptive throttle (see throttle.py), which starts at an edits-per-minute budget and adapts it
+to how the wiki responds. Edits whose save hit an edit conflict, or failed even after the throttle backed off, go to a
+retry queue, which is worked through once the batch is over: the article is loaded again and the recorded operations
+of the edit are replayed on its current revision.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable
+from pywikibot.exceptions import APIError, EditConflictError
+from edit import Edit, SerialEdits, saves_to_wiki
+from general_utils import get_state_name_by_acronym
+from infobox import Infobox
+from job import DEFAULT_EDITS_PER_MINUTE
+from page_utils import get_site, prefetch_city_articles, replication_lag, PREFETCH_GROUP_SIZE
+from throttle import AdaptiveThrottle, pushback_reason, request_error
+
+QUEUE_SIZE = 2 * PREFETCH_GROUP_SIZE
+FETCH_ATTEMPTS = 2  # of each chunk of articles, before its cities are left out
+RETRY_BUDGET = 2  # new attempts of each edit, each one replayed on the current revision of the article
+_END_OF_STREAM = None
+
+
+def is_conflict(error: Exception) -> bool:
+    """Whether the save failed because the article changed since it was loaded."""
+    error = request_error(error)
+    return isinstance(error, EditConflictError) or (isinstance(error, APIError) and error.code == 'editconflict')
+
+
+class RetryQueue:
+    def __init__(self, budget: int = RETRY_BUDGET):
+        self.budget = budget
+        self.pending = deque()
+
+    def offer(self, edit: Edit, error: Exception) -> bool:
+        """Takes the edit whose save failed, if the error is worth a new attempt and the edit has attempts left."""
+        if edit.operations is None or edit.reapplications >= self.budget:
+            return False
+        if not (is_conflict(error) or pushback_reason(error)):
+            return False
+        self.pending.append(edit)
+        return True
+
+    def drain(self, throttle: AdaptiveThrottle = None):
+        """Makes a new attempt for every queued edit, until each one either succeeds or runs out of attempts."""
+        while self.pending:
+            edit = self.pending.popleft()
+            try:
+                edit.reapply()
+            except:
+                edit.report_failure()
+                continue
+            if edit.skipped:
+                edit.report_skip()  # someone else already made the same changes
+                continue
+            edit.save(throttle, self)
+
+
+class EditPipeline:
+    def __init__(self, operation: SerialEdits, edit_infobox: Callable[[Infobox, str, str, dict], None],
+                 edits_per_minute: float = DEFAULT_EDITS_PER_MINUTE, max_edits_per_minute: float = None):
+        """edit_infobox(infobox, city, state acronym, city data) applies the changes of a city to its infobox. The saves
+        start at edits_per_minute and may speed up to max_edits_per_minute while the wiki is healthy."""
+        self.operation = operation
+        self.edit_infobox = edit_infobox
+        self.throttle = AdaptiveThrottle(edits_per_minute, max_edits_per_minute,
+                                         lag_probe=lambda: replication_lag(get_site()))
+        operation.throttle = self.throttle
+        self.retry_queue = RetryQueue()
+        self.fetched = queue.Queue(maxsize=QUEUE_SIZE)
+        self.transformed = queue.Queue(maxsize=QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.jobs_error = None  # raised by run, see _fetch_stage
+
+    def run(self, jobs: Iterable[tuple[str, str, dict]]):
+        """Executes the edits of the (city, state acronym, city data) jobs, in order. An error while producing the jobs,
+        such as loading the data of a state, stops the execution once the edits already fetched are over, and is raised
+        here."""
+        workers = [
+            threading.Thread(target=self._fetch_stage, args=(jobs,), name='fetch', daemon=True),
+            threading.Thread(target=self._transform_stage, name='transform', daemon=True)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            self._save_stage()
+        finally:
+            self.stopped.set()
+            for worker in workers:
+                worker.join()
+        if self.jobs_error:
+            raise self.jobs_error
+
+    def _put(self, target: queue.Queue, item):
+        """Blocking put that gives up when the pipeline was stopped, so no worker is left hanging."""
+        while not self.stopped.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source: queue.Queue):
+        """Blocking get that returns the end of stream when the pipeline was stopped."""
+        while not self.stopped.is_set():
+            try:
+                return source.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
+
+    def _fetch_stage(self, jobs: Iterable[tuple[str, str, dict]]):
+        chunk = []
+        try:
+            for job in jobs:
+                if self.stopped.is_set():
+                    break
+                if self.operation.is_finished(job[0], job[1]):
+                    continue  # already done by the execution being resumed
+                if chunk and (len(chunk) == PREFETCH_GROUP_SIZE or chunk[-1][1] != job[1]):
+                    self._fetch_chunk(chunk)
+                    chunk = []
+                chunk.append(job)
+        except Exception as exception:
+            # the errors of the requests are handled by _fetch_chunk, so this one means that the jobs themselves could
+            # not be produced, and the remaining cities would be silently left out
+            self.jobs_error = exception
+        try:
+            if chunk and not self.stopped.is_set():
+                self._fetch_chunk(chunk)  # the cities already produced are edited even if the rest could not be
+        finally:
+            self._put(self.fetched, _END_OF_STREAM)
+
+    def _fetch_chunk(self, chunk: list[tuple[str, str, dict]]):
+        """Loads the articles of the cities of a state. If the requests keep failing, the cities of the chunk are left
+        out and the execution moves on to the next one."""
+        state_name = get_state_name_by_acronym(chunk[0][1])
+        started_at = time.perf_counter()
+        for attempt in range(1, FETCH_ATTEMPTS + 1):
+            try:
+                articles = prefetch_city_articles([(city, state_name) for city, _, _ in chunk])
+                break
+            except Exception as exception:
+                print(f'error while fetching the articles of {len(chunk)} cities of {state_name} '
+                      f'(attempt {attempt} of {FETCH_ATTEMPTS}):', exception)
+        else:
+            articles = {}
+        lookup_time = (time.perf_counter() - started_at) / len(chunk)  # the batch cost is shared by its cities
+
+        for city, state, data in chunk:
+            if (city, state_name) not in articles:
+                print('could not find the article of', city)
+                continue
+            self._put(self.fetched, (city, state, data, articles[(city, state_name)], lookup_time))
+
+    def _transform_stage(self):
+        try:
+            while True:
+                item = self._get(self.fetched)
+                if item is _END_OF_STREAM:
+                    return
+
+                city, state, data, article, lookup_time = item
+                try:
+                    edit = self.operation.new_edit(city, state, article=article)
+                except:
+                    print('error while creating edit object for', city)
+                    continue
+                edit.timings['lookup'] = lookup_time
+                try:
+                    infobox = edit.get_infobox()
+                    with edit.measure('transform'):
+                        self.edit_infobox(infobox, city, state, data)
+                    edit.prepare(infobox)
+                except:
+                    edit.report_failure()
+                    continue
+                if edit.skipped:
+                    edit.report_skip()  # nothing changed, so there is nothing to save
+                    continue
+                self._put(self.transformed, edit)
+        finally:
+            self._put(self.transformed, _END_OF_STREAM)
+
+    def _save_stage(self):
+        while True:
+            edit = self.transformed.get()
+            if edit is _END_OF_STREAM:
+                break
+            edit.save(self.throttle if saves_to_wiki() else None, self.retry_queue)
+        self.retry_queue.drain(self.throttle if saves_to_wiki() else None)
@@ -0,0 +1,42 @@
+"""
+National and state positions of every municipality for an indicator, computed with a single sort.
+
+Ties follow the standard competition ranking ("1224" ranking): municipalities with the same value share the best
+position among them, and the next municipality skips the positions taken by the tie. So if two cities tie in the
+second place, both are shown as 2º and the following one as 4º.
+"""
+
+from typing import Iterable, Optional
+
+
+class Ranking:
+    def __init__(self, rows: Iterable[tuple], descending: bool = True):
+        """Takes rows formatted as (state, city, value). Rows without value (None) are left out of the ranking.
+        Descending rankings put the highest value in the first position."""
+        self.national_positions = {}
+        self.state_positions = {}
+
+        ranked_rows = sorted((row for row in rows if row[2] is not None), key=lambda row: row[2], reverse=descending)
+
+        last_value = None
+        national_position = 0
+        state_counters = {}  # state -> (amount of cities seen, value of the last one, position of the last one)
+        for index, (state, city, value) in enumerate(ranked_rows, start=1):
+            if index == 1 or value != last_value:
+                national_position = index
+                last_value = value
+
+            seen, state_last_value, state_position = state_counters.get(state, (0, None, 0))
+            seen += 1
+            if seen == 1 or value != state_last_value:
+                state_position = seen
+            state_counters[state] = (seen, value, state_position)
+
+            self.national_positions[(state, city)] = national_position
+            self.state_positions[(state, city)] = state_position
+
+    def national_position(self, state: str, city: str) -> Optional[int]:
+        return self.national_positions.get((state, city))
+
+    def state_position(self, state: str, city: str) -> Optional[int]:
+        return self.state_positions.get((state, city))
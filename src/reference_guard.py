@@ -2,7 +2,44 @@
 was being used in another part of the article, so this module contains utilities to make sure that the bot will
 not leave broken references when editing."""
 
-from typing import Optional
+import re
+from typing import NamedTuple, Optional
+
+# <ref ...>body</ref> or <ref ... />, but not <references />
+REFERENCE_PATTERN = re.compile(r'<ref(?=[\s>/])([^>]*?)(?:/>|>(.*?)</ref\s*>)', re.DOTALL | re.IGNORECASE)
+# the same references, but only outside the markup the wiki does not render: comments (an unclosed one hides the rest
+# of the text) and nowiki. Group 1 only matches that markup, and groups 2 and 3 are the ones of REFERENCE_PATTERN
+LIVE_REFERENCE_PATTERN = re.compile(r'<(?:(!--.*?(?:-->|\Z)|nowiki\s*/>|nowiki\b[^>]*>.*?</nowiki\s*>)'
+                                    r'|ref(?=[\s>/])([^>]*?)(?:/>|>(.*?)</ref\s*>))', re.DOTALL | re.IGNORECASE)
+NAME_ARGUMENT_PATTERN = re.compile(r'name\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s/>]+))', re.IGNORECASE)
+
+
+class ReferenceUsage(NamedTuple):
+    start: int
+    end: int
+    body: Optional[str]  # None for reuses, such as <ref name="x" />
+
+
+def build_reference_index(text: str) -> dict[str, list[ReferenceUsage]]:
+    """Finds every named reference of the text in a single pass. Returns a dict mapping each refname to the spans of
+    its usages, in the order they appear. References inside comments and nowiki are not usages, so they are skipped."""
+    index = {}
+    for match in LIVE_REFERENCE_PATTERN.finditer(text):
+        if match.group(1):
+            continue
+        refname = refname_from_arguments(match.group(2))
+        if refname is None:
+            continue
+        body = match.group(3)
+        index.setdefault(refname, []).append(ReferenceUsage(match.start(), match.end(), body if body else None))
+    return index
+
+
+def refname_from_arguments(arguments: str) -> Optional[str]:
+    name_match = NAME_ARGUMENT_PATTERN.search(arguments)
+    if not name_match:
+        return None
+    return next(group for group in name_match.groups() if group is not None).strip()
 
 
 def extract_refname(text: str) -> Optional[str]:
@@ -11,33 +48,7 @@ def extract_refname(text: str) -> Optional[str]:
     if closing_tag_index == -1:
         raise ReferenceReallocationError
 
-    name_arg_index = text.find('name=')
-    if name_arg_index == -1:
-        spaced_named_arg_index = text.find('name =')
-        if spaced_named_arg_index == -1:
-            return None
-        else:
-            name_arg_index = spaced_named_arg_index + len('name =')
-    else:
-        name_arg_index += len('name=')
-
-    if name_arg_index > closing_tag_index:
-        return None
-
-    between_quotes = False
-    refname = ''
-    while True:
-        if text[name_arg_index] == '>':
-            break
-        if not between_quotes and text[name_arg_index] in (' ', '/'):
-            break
-        if text[name_arg_index] in ('"', "'"):
-            between_quotes = not between_quotes
-        if text[name_arg_index] not in (' ', '"', "'", '>'):
-            refname += text[name_arg_index]
-        name_arg_index += 1
-
-    return refname
+    return refname_from_arguments(text[:closing_tag_index])
 
 
 def extract_body(text: str):
@@ -54,41 +65,33 @@ def extract_body(text: str):
 
 
 def inject_body_in_reuse_reference(text: str, refname: str, body: str):
-    index = text.index(refname) + len(refname)
-    while index < len(text):
-        if text[index:index + 2] == '/>':
-            return text[:index] + '>' + body + '</ref>'
-        if text[index] == '>':
-            return text[:index + 1] + body + text[index + 1:]
-        index += 1
-
-    else:
+    """Turns a reuse of the reference (<ref name="x" />) into its full form, with the given body."""
+    match = REFERENCE_PATTERN.fullmatch(text.strip())
+    if not match or match.group(2) or refname_from_arguments(match.group(1)) != refname:
         raise ReferenceReallocationError
-
-
-# def find_next_usage(article_raw: str, refname: str):
-#     first_usage_index = article_raw.index(refname) + len(refname)
-#     text = article_raw[first_usage_index:]
-#
-#     next_usage_start_index = -1
-#     next_usage_end_index = -1
-#
-#     while True:
-#         usage_candidate_index = text.find(refname)
-#         if usage_candidate_index == -1:
-#             return None
-#         look_backwards_index = usage_candidate_index
-#         while look_backwards_index + 10 > usage_candidate_index:
-#             look_backwards_index -= 1
-#             if text[look_backwards_index - 2:look_backwards_index + 1] == 'ref':
-#                 look_backwards_index -= 2
-#                 while text[look_backwards_index] != '<':
-#                     look_backwards_index -= 1
-#                 next_usage_start_index = first_usage_index + look_backwards_index
-#                 break
-#
-#         else:
-#             continue
+    return '<ref' + match.group(1).rstrip() + '>' + body + '</ref>'
+
+
+def reallocate_removed_references(text: str, removed_references: dict[str, str]) -> str:
+    """Takes the article text after named references were removed from it, mapped to their bodies. If a removed
+    reference is still reused somewhere else, its body is moved to the next usage, so the reuses are not left
+    broken."""
+    if not removed_references:
+        return text
+    index = build_reference_index(text)
+    injections = []
+    for refname, body in removed_references.items():
+        usages = index.get(refname)
+        if not usages or any(usage.body for usage in usages):
+            continue  # not used anymore, or some usage still holds the body
+        injections.append((usages[0], refname, body))
+
+    # from the end to the start, so the spans of the remaining usages stay valid
+    for usage, refname, body in sorted(injections, key=lambda injection: injection[0].start, reverse=True):
+        full_reference = inject_body_in_reuse_reference(text[usage.start:usage.end], refname, body)
+        text = text[:usage.start] + full_reference + text[usage.end:]
+
+    return text
 
 
 class ReferenceReallocationError(Exception):
@@ -0,0 +1,138 @@
+"""
+Adaptive pacing of the saves. The edit rate grows a little after every healthy save, and is halved whenever the wiki
+pushes back: replication lag above maxlag, a rate limit, a server error (HTTP 5xx) or a save slow enough to mean the
+server is struggling. A pushback also pauses the saves for an exponentially growing delay, which resets after the next
+healthy save. Saves that failed because of a pushback are retried by Edit.save.
+
+Keep in mind that pywikibot's own put_throttle (user-config.py) is also applied to every save, so it must not be
+stricter than the maximum rate, and that pywikibot already waits and retries internally on some of these responses.
+"""
+
+import time
+from typing import Callable, Optional
+from pywikibot.exceptions import APIError, MaxlagTimeoutError, ServerError
+
+MAXLAG = 5  # seconds of replication lag, the same default of pywikibot (config.maxlag)
+LAG_CHECK_INTERVAL = 10  # seconds between checks of the replication lag
+SLOW_SAVE_SECONDS = 15
+RATE_INCREASE = 0.5  # edits per minute added after each healthy save
+BACKOFF_BASE_SECONDS = 5
+MAX_BACKOFF_SECONDS = 300
+
+
+def request_error(error: Exception) -> Exception:
+    """The error of the request behind a failed save, which OtherPageSaveError wraps as its reason."""
+    if isinstance(getattr(error, 'reason', None), Exception):
+        return error.reason
+    return error
+
+
+def pushback_reason(error: Exception) -> Optional[str]:
+    """Whether the error of a save means that the wiki is asking the bot to slow down, and why."""
+    error = request_error(error)
+    if isinstance(error, MaxlagTimeoutError) or (isinstance(error, APIError) and error.code == 'maxlag'):
+        return 'lag'
+    if isinstance(error, APIError) and error.code == 'ratelimited':
+        return 'rate limit'
+    if isinstance(error, ServerError):
+        return 'server error'
+    return None
+
+
+class AdaptiveThrottle:
+    def __init__(self, edits_per_minute: float, max_edits_per_minute: float = None, min_edits_per_minute: float = 1,
+                 lag_probe: Callable[[], float] = None, maxlag: float = MAXLAG):
+        """Starts at edits_per_minute and never goes beyond the bounds. lag_probe() returns the current replication
+        lag of the wiki, in seconds; without it, the lag is only noticed through the errors of the saves."""
+        self.rate = edits_per_minute
+        self.max_rate = max_edits_per_minute or edits_per_minute
+        self.min_rate = min(min_edits_per_minute, edits_per_minute)
+        self.lag_probe = lag_probe
+        self.maxlag = maxlag
+        self.next_slot = 0
+        self.backoff_until = 0
+        self.next_lag_check = 0
+        self.consecutive_backoffs = 0
+        self.backoffs = {}  # reason -> count
+        self.backoff_time = 0
+        self.max_lag_seen = 0
+        self.save_count = 0
+        self.first_save_at = None
+        self.last_save_at = None
+
+    def wait(self):
+        """Blocks until the next save fits in the current rate, the backoff is over and the lag is healthy."""
+        while True:
+            now = time.monotonic()
+            ready_at = max(self.next_slot, self.backoff_until)
+            if now < ready_at:
+                time.sleep(ready_at - now)
+
+            if self.lag_probe and time.monotonic() >= self.next_lag_check:
+                self.next_lag_check = time.monotonic() + LAG_CHECK_INTERVAL
+                try:
+                    lag = self.lag_probe()
+                except Exception as error:
+                    if pushback_reason(error) == 'lag':  # pywikibot already waited and retried, and the lag stayed high
+                        self.back_off('lag')
+                        self.next_lag_check = 0  # checked again once the pause is over
+                        continue
+                    # the lag is unknown until the next check, and a lagged wiki still shows in the errors of the saves
+                    print('Could not check the replication lag:', error)
+                    break
+                self.max_lag_seen = max(self.max_lag_seen, lag)
+                if lag >= self.maxlag:
+                    self.back_off('lag')
+                    self.next_lag_check = 0
+                    continue
+            break
+
+        self.next_slot = time.monotonic() + 60 / self.rate
+
+    def record(self, duration: float, error: Exception = None) -> bool:
+        """Adapts the rate to the outcome of a save that took duration seconds. Returns whether the save failed
+        because of a pushback, in which case it may be retried."""
+        reason = pushback_reason(error) if error else None
+        if reason:
+            self.back_off(reason)
+            return True
+        if error:
+            return False  # not the fault of the server, such as an edit conflict
+
+        now = time.monotonic()
+        self.save_count += 1
+        self.first_save_at = self.first_save_at or now - duration
+        self.last_save_at = now
+        if duration > SLOW_SAVE_SECONDS:
+            self.back_off('slow save')
+        else:
+            self.consecutive_backoffs = 0
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+        return False
+
+    def back_off(self, reason: str):
+        self.consecutive_backoffs += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        delay = min(BACKOFF_BASE_SECONDS * 2 ** (self.consecutive_backoffs - 1), MAX_BACKOFF_SECONDS)
+        self.backoff_until = time.monotonic() + delay
+        self.backoff_time += delay
+        self.backoffs[reason] = self.backoffs.get(reason, 0) + 1
+        print(f'Slowing down ({reason}): pausing the saves for {delay}s, then {self.rate:.1f} edits per minute')
+
+    def achieved_edits_per_minute(self) -> Optional[float]:
+        """Successful saves per minute, from the start of the first one to the end of the last one. None below two
+        saves, since a single save only measures how long it took."""
+        if self.save_count < 2 or self.last_save_at == self.first_save_at:
+            return None
+        return self.save_count / ((self.last_save_at - self.first_save_at) / 60)
+
+    def report(self) -> dict:
+        achieved_rate = self.achieved_edits_per_minute()
+        return {
+            'saves': self.save_count,
+            'edits_per_minute': round(achieved_rate, 2) if achieved_rate is not None else None,
+            'final_rate': round(self.rate, 2),
+            'backoffs': dict(self.backoffs),
+            'backoff_seconds': self.backoff_time,
+            'max_lag_seen': round(self.max_lag_seen, 2)
+        }
@@ -0,0 +1,61 @@
+"""
+Persistent cache of the article resolved for each city, so later executions load it directly instead of probing the
+bare title and the "City (State)" title again. An entry is discarded whenever the cached page turns out to be a
+redirect (the article was moved), has another page id, or no longer passes is_city_article.
+"""
+
+import json
+import os
+from local_site import is_local_site_enabled, local_output_path
+from typing import Optional
+
+TITLE_CACHE_PATH = 'title_cache.json'
+
+
+class TitleCache:
+    def __init__(self, path: str = TITLE_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.changed = False
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.entries = json.load(file)
+
+    @staticmethod
+    def _key(city: str, state: str):
+        return f'{state}|{city}'
+
+    def get(self, city: str, state: str) -> Optional[dict]:
+        """Returns the cached entry, formatted as {'title': str, 'pageid': int}, or None."""
+        return self.entries.get(self._key(city, state))
+
+    def store(self, city: str, state: str, article):
+        entry = {'title': article.title(), 'pageid': article.pageid}
+        if self.entries.get(self._key(city, state)) != entry:
+            self.entries[self._key(city, state)] = entry
+            self.changed = True
+
+    def discard(self, city: str, state: str):
+        if self.entries.pop(self._key(city, state), None):
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.entries, file, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(temporary_path, self.path)  # never leaves a truncated cache behind
+        self.changed = False
+
+
+_default_cache = None
+
+
+def get_title_cache() -> TitleCache:
+    global _default_cache
+    if _default_cache is None:
+        # executions against the local stand-in keep their own cache, see local_site.py
+        path = local_output_path(TITLE_CACHE_PATH) if is_local_site_enabled() else TITLE_CACHE_PATH
+        _default_cache = TitleCache(path)
+    return _default_cache
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules of the bot import each other by their bare names, as when running src/main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+os.environ.setdefault('PYWIKIBOT_NO_USER_CONFIG', '2')  # the tests run offline, without a user-config.py
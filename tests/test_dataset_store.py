@@ -0,0 +1,39 @@
+import os
+import dataset_store
+
+COLUMNS = ('code', 'area', 'hdi', 'igp_per_capita')
+
+
+def write_info_table(path: str, rows: list[tuple[str, str]]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write('Municípios\nFonte: IBGE\nMunicípio;Código' + 11 * ';' + '\n')
+        for city, code in rows:
+            cells = [city, code] + 11 * ['']
+            cells[4], cells[8], cells[12] = '10,5', '0,700', '20000,00'
+            file.write(';'.join(cells) + '\n')
+
+
+def test_renamed_source_replaces_the_rows_of_the_old_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_store, 'STORE_PATH', str(tmp_path / 'datasets.sqlite3'))
+    monkeypatch.setattr(dataset_store, '_connection', None)
+    monkeypatch.setattr(dataset_store, '_loaded_datasets', {})
+    _, schema, _ = dataset_store.DATASETS['municipality_info']
+    rows = [('Acrelândia', '1200013'), ('Assis Brasil', '1200054')]
+
+    old_source = str(tmp_path / '2021' / 'info-ac.csv')
+    write_info_table(old_source, rows)
+    monkeypatch.setitem(dataset_store.DATASETS, 'municipality_info', (COLUMNS, schema, (old_source,)))
+    assert len(dataset_store.read_dataset('municipality_info')) == 2
+
+    new_source = str(tmp_path / '2022' / 'info-ac.csv')
+    write_info_table(new_source, rows)
+    monkeypatch.setitem(dataset_store.DATASETS, 'municipality_info', (COLUMNS, schema, (new_source,)))
+    dataset_store._loaded_datasets.clear()
+    try:
+        assert [row[:3] for row in dataset_store.read_dataset('municipality_info')] == \
+            [('AC', 'Acrelândia', '1200013'), ('AC', 'Assis Brasil', '1200054')]
+        manifest = dataset_store.get_store().execute('SELECT source FROM manifest').fetchall()
+        assert manifest == [(new_source,)]
+    finally:
+        dataset_store.get_store().close()
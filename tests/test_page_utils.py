@@ -0,0 +1,72 @@
+from collections import Counter
+from local_site import LocalPage, LocalSite
+from page_utils import PREFETCH_GROUP_SIZE, prefetch_city_articles
+from title_cache import TitleCache
+
+CITY_ARTICLE = '{{Info/Município do Brasil\n| nome = Cidade\n}}\nCidade é um município brasileiro.'
+DISAMBIGUATION = '{{Desambiguação|}}\nBom Jesus pode referir-se a vários municípios.'
+
+
+class CountingSite(LocalSite):
+    """Local site that counts how many times each page was loaded."""
+
+    def __init__(self, pages: dict[str, str]):
+        super().__init__(pages)
+        self.loads = Counter()
+
+    def page_source(self, title: str):
+        self.loads[title] += 1
+        return super().page_source(title)
+
+
+def prefetch(site: LocalSite, cities: list[tuple[str, str]], tmp_path) -> dict:
+    return prefetch_city_articles(cities, wiki=site, page_factory=LocalPage,
+                                  title_cache=TitleCache(str(tmp_path / 'title_cache.json')))
+
+
+def test_one_request_per_group_of_titles(tmp_path):
+    cities = [(f'Cidade {number}', 'Acre') for number in range(2 * PREFETCH_GROUP_SIZE + 20)]
+    site = LocalSite({city: CITY_ARTICLE for city, _ in cities})
+
+    articles = prefetch(site, cities, tmp_path)
+
+    assert len(articles) == len(cities)
+    assert site.request_count == 3
+
+
+def test_falls_back_to_the_title_with_the_state(tmp_path):
+    site = LocalSite({
+        'Mesquita': DISAMBIGUATION,
+        'Mesquita (Minas Gerais)': CITY_ARTICLE,
+        'Bonito': 'Bonito é um adjetivo.',
+        'Bonito (Pará)': CITY_ARTICLE,
+        'Acrelândia': CITY_ARTICLE
+    })
+
+    articles = prefetch(site, [('Mesquita', 'Minas Gerais'), ('Bonito', 'Pará'), ('Acrelândia', 'Acre')], tmp_path)
+
+    assert {city: article.title() for (city, _), article in articles.items()} == {
+        'Mesquita': 'Mesquita (Minas Gerais)', 'Bonito': 'Bonito (Pará)', 'Acrelândia': 'Acrelândia'}
+    assert site.request_count == 2  # the bare titles, then the titles with the state
+
+
+def test_shared_bare_title_is_loaded_once(tmp_path):
+    site = CountingSite({
+        'Bom Jesus': DISAMBIGUATION,
+        'Bom Jesus (Piauí)': CITY_ARTICLE,
+        'Bom Jesus (Santa Catarina)': CITY_ARTICLE
+    })
+
+    articles = prefetch(site, [('Bom Jesus', 'Piauí'), ('Bom Jesus', 'Santa Catarina')], tmp_path)
+
+    assert articles[('Bom Jesus', 'Piauí')].title() == 'Bom Jesus (Piauí)'
+    assert articles[('Bom Jesus', 'Santa Catarina')].title() == 'Bom Jesus (Santa Catarina)'
+    assert site.loads['Bom Jesus'] == 1
+
+
+def test_missing_cities_are_left_out(tmp_path):
+    site = LocalSite({'Acrelândia': CITY_ARTICLE, 'Capixaba': 'Capixaba é um gentílico.'})
+
+    articles = prefetch(site, [('Acrelândia', 'Acre'), ('Capixaba', 'Acre'), ('Inexistente', 'Acre')], tmp_path)
+
+    assert list(articles) == [('Acrelândia', 'Acre')]
@@ -0,0 +1,33 @@
+from ranking import Ranking
+
+
+def test_ties_share_the_best_position_and_skip_the_next_ones():
+    ranking = Ranking([('AC', 'A', 300), ('AC', 'B', 200), ('AL', 'C', 200), ('AL', 'D', 100), ('AC', 'E', 50)])
+
+    assert [ranking.national_position(state, city) for state, city in
+            [('AC', 'A'), ('AC', 'B'), ('AL', 'C'), ('AL', 'D'), ('AC', 'E')]] == [1, 2, 2, 4, 5]
+
+
+def test_state_positions_only_count_the_cities_of_the_state():
+    ranking = Ranking([('AC', 'A', 300), ('AL', 'B', 250), ('AC', 'C', 200), ('AC', 'D', 200), ('AL', 'E', 200),
+                       ('AC', 'F', 100)])
+
+    assert [ranking.state_position('AC', city) for city in 'ACDF'] == [1, 2, 2, 4]
+    assert [ranking.state_position('AL', city) for city in 'BE'] == [1, 2]
+    assert [ranking.national_position('AC', city) for city in 'ACDF'] == [1, 3, 3, 6]
+
+
+def test_ascending_ranking_puts_the_lowest_value_first():
+    ranking = Ranking([('AC', 'A', 0.5), ('AC', 'B', 0.4), ('AC', 'C', 0.4), ('AC', 'D', 0.6)], descending=False)
+
+    assert [ranking.national_position('AC', city) for city in 'ABCD'] == [3, 1, 1, 4]
+    assert [ranking.state_position('AC', city) for city in 'ABCD'] == [3, 1, 1, 4]
+
+
+def test_cities_without_value_are_left_out():
+    ranking = Ranking([('AC', 'A', None), ('AC', 'B', 10), ('AC', 'C', 20)])
+
+    assert ranking.national_position('AC', 'A') is None
+    assert ranking.state_position('AC', 'A') is None
+    assert ranking.national_position('AC', 'C') == 1
+    assert ranking.state_position('AC', 'B') == 2
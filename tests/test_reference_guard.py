@@ -0,0 +1,75 @@
+from infobox import Infobox
+from reference_guard import reallocate_removed_references
+
+IBGE_BODY = '{{citar web|url=https://www.ibge.gov.br/|titulo=Cidades e Estados|acessodata=1 de maio de 2022}}'
+NEW_REFERENCE = '<ref name="ATT_BOT_POP_0522">{{citar web|url=https://ftp.ibge.gov.br/|titulo=Estimativas}}</ref>'
+
+
+class Article:
+    """Just the parts of pywikibot.Page that Infobox reads."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def title(self):
+        return 'Cidade'
+
+    def full_url(self):
+        return 'https://pt.wikipedia.org/wiki/Cidade'
+
+
+def test_removed_reference_body_moves_to_its_next_reuse():
+    text = 'A cidade tem 100 habitantes.<ref name="ibge" /> Sua área é de 10 km².<ref name=\'ibge\'/>'
+
+    new_text = reallocate_removed_references(text, {'ibge': IBGE_BODY})
+
+    assert new_text == f'A cidade tem 100 habitantes.<ref name="ibge">{IBGE_BODY}</ref> ' \
+                       'Sua área é de 10 km².<ref name=\'ibge\'/>'
+
+
+def test_removed_reference_still_defined_elsewhere_is_left_alone():
+    text = f'Texto.<ref name="ibge" /> Mais texto.<ref name="ibge">{IBGE_BODY}</ref>'
+
+    assert reallocate_removed_references(text, {'ibge': IBGE_BODY}) == text
+
+
+def test_removed_reference_no_longer_used_is_left_alone():
+    text = 'Texto sem referências.<ref name="outra">{{citar web|url=https://example.org/}}</ref>'
+
+    assert reallocate_removed_references(text, {'ibge': IBGE_BODY}) == text
+
+
+def test_reuses_inside_comments_and_nowiki_are_not_usages():
+    text = 'Texto <!-- antiga <ref name="ibge"/> --> e <nowiki><ref name="ibge"/></nowiki> depois.<ref name="ibge"/>'
+
+    new_text = reallocate_removed_references(text, {'ibge': IBGE_BODY})
+
+    assert new_text == 'Texto <!-- antiga <ref name="ibge"/> --> e <nowiki><ref name="ibge"/></nowiki> ' \
+                       f'depois.<ref name="ibge">{IBGE_BODY}</ref>'
+
+
+def test_body_defined_only_inside_a_comment_is_moved_to_the_live_reuse():
+    text = f'Texto <!-- <ref name="ibge">{IBGE_BODY}</ref> --> depois.<ref name="ibge"/>'
+
+    new_text = reallocate_removed_references(text, {'ibge': IBGE_BODY})
+
+    assert new_text.endswith(f'depois.<ref name="ibge">{IBGE_BODY}</ref>')
+
+
+def test_removed_reference_body_moves_to_a_reuse_inside_the_infobox():
+    article = Article('{{Info/Município do Brasil\n'
+                      '| nome = Cidade\n'
+                      '| área = 10\n'
+                      '| área_ref = <ref name=ibge/>\n'
+                      '| população = 100\n'
+                      f'| população_ref = <ref name="ibge">{IBGE_BODY}</ref>\n'
+                      '}}\n'
+                      'Cidade é um município brasileiro.<ref name="ibge" />\n')
+    infobox = Infobox(article)
+
+    infobox.edit_population(120, 2021, reference=NEW_REFERENCE)
+    new_text = infobox.render_article()
+
+    assert f'| área_ref = <ref name=ibge>{IBGE_BODY}</ref>\n' in new_text
+    assert f'| população_ref = {NEW_REFERENCE}\n' in new_text
+    assert new_text.endswith('Cidade é um município brasileiro.<ref name="ibge" />\n')
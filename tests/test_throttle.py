@@ -0,0 +1,133 @@
+import pytest
+import local_site
+import throttle
+from local_site import LocalPage, LocalSite
+from pywikibot.exceptions import APIError
+from throttle import AdaptiveThrottle
+
+
+class Clock:
+    """Stands in for the time module, so the backoffs and the lag of the local site pass without waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds: float):
+        self.now += max(0.0, seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(throttle, 'time', clock)
+    monkeypatch.setattr(local_site, 'time', clock)
+    return clock
+
+
+def save(pacing: AdaptiveThrottle, page: LocalPage, clock: Clock) -> bool:
+    """Saves the page as Edit.save_to_wiki does, once. Returns whether the wiki pushed back."""
+    pacing.wait()
+    started_at = clock.monotonic()
+    try:
+        page.text += '.'
+        page.save()
+    except Exception as error:
+        return pacing.record(clock.monotonic() - started_at, error)
+    pacing.record(clock.monotonic() - started_at)
+    return False
+
+
+def new_page(site: LocalSite):
+    site.store_page('Cidade', 'texto')
+    return LocalPage(site, 'Cidade')
+
+
+def test_backs_off_when_the_saves_are_refused_for_lag(clock):
+    site = LocalSite(lag_per_save=30)
+    page = new_page(site)
+    pacing = AdaptiveThrottle(60, 120)
+
+    assert not save(pacing, page, clock)
+    assert save(pacing, page, clock)  # 30 seconds of lag, far above maxlag
+    assert site.statistics()['maxlag_errors'] == 1
+    assert pacing.backoffs == {'lag': 1}
+    assert pacing.rate == 30.25  # 60.5 after the healthy save, then halved
+
+
+def test_lag_probe_backs_off_before_saving(clock):
+    site = LocalSite(lag_per_save=30)
+    page = new_page(site)
+    pacing = AdaptiveThrottle(6, lag_probe=site.replication_lag)
+
+    save(pacing, page, clock)
+    save(pacing, page, clock)  # ten seconds later, the lag is still twenty seconds
+
+    assert pacing.backoffs['lag'] >= 1
+    assert site.maxlag_count == 0  # the probe kept the saves from being refused
+    assert pacing.max_lag_seen == 20
+
+
+def test_backs_off_on_server_errors(clock):
+    page = new_page(LocalSite(failure_rate=1))
+    pacing = AdaptiveThrottle(6)
+
+    assert save(pacing, page, clock)
+    assert pacing.backoffs == {'server error': 1}
+    assert pacing.rate == 3
+
+
+def test_backs_off_on_slow_saves(clock):
+    page = new_page(LocalSite(latency=throttle.SLOW_SAVE_SECONDS + 1))
+    pacing = AdaptiveThrottle(6)
+
+    assert not save(pacing, page, clock)  # the save went through, so there is nothing to retry
+    assert pacing.backoffs == {'slow save': 1}
+    assert pacing.rate == 3
+
+
+def test_rate_recovers_after_healthy_saves(clock):
+    site = LocalSite(failure_rate=1)
+    page = new_page(site)
+    pacing = AdaptiveThrottle(6, 8)
+
+    save(pacing, page, clock)
+    assert pacing.rate == 3
+    site.failure_rate = 0
+    for _ in range(20):
+        save(pacing, page, clock)
+
+    assert pacing.rate == 8  # the maximum
+    assert pacing.consecutive_backoffs == 0
+    assert pacing.report()['saves'] == 20
+
+
+def test_failing_lag_probe_lets_the_save_go_on(clock):
+    def broken_probe():
+        raise ConnectionError('siteinfo unavailable')
+
+    page = new_page(LocalSite())
+    pacing = AdaptiveThrottle(6, lag_probe=broken_probe)
+
+    assert not save(pacing, page, clock)
+    assert pacing.backoffs == {}
+    assert pacing.report()['saves'] == 1
+
+
+def test_lag_probe_refused_for_lag_backs_off(clock):
+    refusals = ['maxlag']
+
+    def lagged_probe():
+        if refusals:
+            raise APIError(refusals.pop(), 'Waiting for a database server: 8 seconds lagged')
+        return 0
+
+    page = new_page(LocalSite())
+    pacing = AdaptiveThrottle(6, lag_probe=lagged_probe)
+
+    assert not save(pacing, page, clock)
+    assert pacing.backoffs == {'lag': 1}